@@ -0,0 +1,128 @@
+import copy
+import hashlib
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+
+def cache_key(key):
+    # Сами токены в ключи кэша не попадают.
+    return f'api:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+class TokenCache:
+    """Пользователи по токенам: LRU в памяти процесса перед общим кэшем.
+
+    Локальная запись живёт local_ttl секунд, в общем кэше — shared_ttl.
+    В LRU хранится сам пользователь, каждый запрос получает его копию;
+    в общий кэш он записывается сериализованным. invalidate() удаляет
+    запись из общего кэша и из LRU текущего процесса; в других
+    процессах она устаревает не позже чем через local_ttl.
+
+    LocMemCache у каждого процесса свой, и сброс из одного воркера не
+    дошёл бы до остальных, поэтому с ним кэш токенов выключен целиком.
+    """
+
+    def __init__(self, size, local_ttl, shared_ttl):
+        self.size = size
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.stats = Counter()
+
+    @property
+    def enabled(self):
+        return (self.shared_ttl > 0
+                and not isinstance(caches['default'], LocMemCache))
+
+    def count(self, event):
+        with self.lock:
+            self.stats[event] += 1
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        name = cache_key(key)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(name)
+                self.stats['local_hits'] += 1
+                return copy.copy(entry[0])
+        data = cache.get(name)
+        if data is None:
+            self.count('misses')
+            return None
+        self.count('shared_hits')
+        user = pickle.loads(data)
+        self._remember(name, user)
+        return copy.copy(user)
+
+    def set(self, key, user):
+        if not self.enabled:
+            return
+        name = cache_key(key)
+        cache.set(name, pickle.dumps(user), self.shared_ttl)
+        self._remember(name, copy.copy(user))
+
+    def invalidate(self, *keys):
+        names = [cache_key(key) for key in keys]
+        if self.enabled:
+            cache.delete_many(names)
+        with self.lock:
+            for name in names:
+                self.entries.pop(name, None)
+            self.stats['invalidations'] += len(names)
+
+    def invalidate_user(self, user_id):
+        self.invalidate(*Token.objects.filter(
+            user_id=user_id).values_list('key', flat=True))
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def _remember(self, name, user):
+        if not self.size:
+            return
+        with self.lock:
+            self.entries[name] = (user, time.monotonic() + self.local_ttl)
+            self.entries.move_to_end(name)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+token_cache = TokenCache(
+    size=settings.AUTH_TOKEN_CACHE_SIZE,
+    local_ttl=settings.AUTH_TOKEN_LOCAL_TTL,
+    shared_ttl=settings.AUTH_TOKEN_CACHE_TTL,
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД при попадании в token_cache.
+
+    Записи сбрасываются сигналами: при удалении токена (выход) и при
+    сохранении пользователя (смена пароля, деактивация).
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+            return user, token
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
@@ -0,0 +1,104 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from .conditional import get_validators, is_conditional, not_modified
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+RECIPES = 'recipes'
+
+
+def version_key(namespace):
+    return f'api:version:{namespace}'
+
+
+def get_version(namespace):
+    # Версии хранятся бессрочно; если ключ всё же вытеснен, новая версия
+    # от текущего времени не совпадёт ни с одной из прежних.
+    key = version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*namespaces):
+    for namespace in namespaces:
+        try:
+            cache.incr(version_key(namespace))
+        except ValueError:
+            get_version(namespace)
+
+
+def count(namespace, event):
+    key = f'api:stats:{namespace}:{event}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_stats(namespaces=(TAGS, INGREDIENTS, RECIPES)):
+    """Счётчики попаданий и промахов кэша по пространствам имён."""
+    keys = {
+        f'api:stats:{namespace}:{event}': (namespace, event)
+        for namespace in namespaces
+        for event in ('hits', 'misses')
+    }
+    values = cache.get_many(keys)
+    stats = {namespace: {'hits': 0, 'misses': 0} for namespace in namespaces}
+    for key, (namespace, event) in keys.items():
+        stats[namespace][event] = values.get(key, 0)
+    return stats
+
+
+class CachedResponseMixin:
+    """Кэширует сериализованные ответы list и retrieve.
+
+    Ключ строится из пути с параметрами запроса и версии пространства
+    имён cache_namespace, которую сигналы увеличивают при изменении
+    данных, так что устаревшие записи просто перестают читаться.
+    Вместе с данными хранятся ETag и Last-Modified ответа: по ним
+    попадание в кэш тоже может закончиться ответом 304.
+    """
+    cache_namespace = None
+
+    def should_cache(self, request):
+        return True
+
+    def get_cache_key(self, request):
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        version = get_version(self.cache_namespace)
+        return f'api:{self.cache_namespace}:response:{version}:{path}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.should_cache(request):
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            count(self.cache_namespace, 'hits')
+            data, validators = cached
+            if not is_conditional(request):
+                validators = {}
+            response = (not_modified(request, validators)
+                        or Response(data, headers=validators))
+            response['X-Cache'] = 'HIT'
+            return response
+        count(self.cache_namespace, 'misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, (response.data, get_validators(response)))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request,
+                                    *args, **kwargs)
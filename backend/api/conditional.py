@@ -0,0 +1,114 @@
+import hashlib
+
+from django.db.models import prefetch_related_objects
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified')
+
+
+def is_conditional(request):
+    # Версия считается для JSON: у браузерного API свои формы и ссылки.
+    return (request.method in ('GET', 'HEAD')
+            and request.accepted_renderer.format == 'json')
+
+
+def get_validators(response):
+    return {name: response[name] for name in VALIDATOR_HEADERS
+            if response.has_header(name)}
+
+
+def not_modified(request, validators):
+    """Ответ 304, если If-None-Match или If-Modified-Since совпадают
+    с validators (заголовками ETag и Last-Modified), иначе None."""
+    if not validators or not is_conditional(request):
+        return None
+    response = get_conditional_response(
+        request,
+        etag=validators.get('ETag'),
+        last_modified=parse_http_date_safe(validators.get('Last-Modified')),
+    )
+    if response is not None:
+        for name, value in validators.items():
+            response[name] = value
+    return response
+
+
+class ConditionalGetMixin:
+    """ETag и Last-Modified для list и retrieve.
+
+    Версия ответа строится из объектов страницы, загруженных без
+    prefetch: get_versions() возвращает версию каждого объекта,
+    get_last_modified() — время изменения, если оно известно точно.
+    При совпадении If-None-Match или If-Modified-Since ответ 304
+    отдаётся до prefetch и сериализации.
+    """
+
+    def get_prefetches(self):
+        return ()
+
+    def get_versions(self, objects):
+        raise NotImplementedError
+
+    def get_last_modified(self, objects):
+        return None
+
+    def get_object_validators(self, objects, *parts):
+        request = self.request
+        if not is_conditional(request):
+            return {}
+        version = hashlib.md5(repr((
+            request.build_absolute_uri(), request.user.pk, parts,
+            self.get_versions(objects),
+        )).encode()).hexdigest()
+        validators = {'ETag': quote_etag(version)}
+        last_modified = self.get_last_modified(objects)
+        if last_modified is not None:
+            validators['Last-Modified'] = http_date(
+                last_modified.timestamp())
+        return validators
+
+    def conditional_response(self, respond, objects, *parts):
+        validators = self.get_object_validators(objects, *parts)
+        response = not_modified(self.request, validators)
+        if response is not None:
+            return response
+        prefetch_related_objects(objects, *self.get_prefetches())
+        response = respond()
+        for name, value in validators.items():
+            response[name] = value
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(
+            self.get_queryset()).prefetch_related(None)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            objects = list(queryset)
+            return self.conditional_response(
+                lambda: Response(
+                    self.get_serializer(objects, many=True).data),
+                objects,
+            )
+        # Ссылки на соседние страницы и count тоже входят в версию.
+        envelope = self.get_paginated_response([]).data
+        return self.conditional_response(
+            lambda: self.get_paginated_response(
+                self.get_serializer(page, many=True).data),
+            page, envelope,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        # Как get_object(), но без prefetch.
+        queryset = self.filter_queryset(
+            self.get_queryset()).prefetch_related(None)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        instance = get_object_or_404(
+            queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, instance)
+        return self.conditional_response(
+            lambda: Response(self.get_serializer(instance).data),
+            [instance],
+        )
@@ -0,0 +1,187 @@
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db.models import Manager
+from recipes.images import get_variant_urls
+
+from .metrics import timer
+from .serializers import (RecipeReadSerializer, RecipeShortSerializer,
+                          SubscribeSerializer)
+from .viewer_state import (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS, get_flag,
+                           prime_recipes)
+
+
+class FastSerializer(ABC):
+    """Сериализатор только для чтения без полей DRF.
+
+    Словари собираются напрямую из объектов с prefetch и аннотациями,
+    которые готовят представления. Ответ совпадает с ответом
+    сериализатора DRF, которого класс заменяет; это проверяет
+    SerializerContractTest в api/tests.py.
+    """
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @property
+    def data(self):
+        with timer('serializer'):
+            if not self.many:
+                return self.to_representation(self.instance)
+            items = list(self.instance.all()
+                         if isinstance(self.instance, Manager)
+                         else self.instance)
+            viewer = self.context.get('viewer')
+            if viewer is not None:
+                self.prime_viewer_state(viewer, items)
+            return [self.to_representation(item) for item in items]
+
+    def prime_viewer_state(self, viewer, items):
+        """Готовит состояние пользователя для всех объектов списка."""
+
+    @abstractmethod
+    def to_representation(self, instance):
+        """Словарь ответа для одного объекта, как у заменяемого
+        сериализатора DRF."""
+
+
+def user_data(user, context):
+    if user is None:
+        return None
+    return {
+        'email': user.email,
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_subscribed': get_flag(user, 'is_subscribed', SUBSCRIPTIONS,
+                                  context),
+    }
+
+
+class RecipeImageMixin:
+    """Поля image и image_variants, как у ImageVariantsMixin."""
+
+    def image_fields(self, recipe):
+        request = self.context.get('request')
+        image = recipe.image.url if recipe.image else None
+        if image is not None and request is not None:
+            image = request.build_absolute_uri(image)
+        variants = get_variant_urls(recipe, request)
+        variant = variants.get(self.context.get('image_variant'))
+        if variant is not None:
+            image = variant['url']
+        return image, variants
+
+
+class FastRecipeShortSerializer(RecipeImageMixin, FastSerializer):
+
+    def to_representation(self, recipe):
+        image, variants = self.image_fields(recipe)
+        return {
+            'id': recipe.id,
+            'name': recipe.name,
+            'image': image,
+            'image_variants': variants,
+            'cooking_time': recipe.cooking_time,
+        }
+
+
+class FastRecipeReadSerializer(RecipeImageMixin, FastSerializer):
+
+    def prime_viewer_state(self, viewer, recipes):
+        prime_recipes(viewer, recipes)
+
+    def to_representation(self, recipe):
+        image, variants = self.image_fields(recipe)
+        return {
+            'id': recipe.id,
+            'tags': [
+                {'id': tag.id, 'name': tag.name, 'color': tag.color,
+                 'slug': tag.slug}
+                for tag in recipe.tags.all()
+            ],
+            'author': user_data(recipe.author, self.context),
+            'ingredients': [
+                {
+                    'id': item.ingredient.id,
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                }
+                for item in recipe.ingredient_list.all()
+            ],
+            'is_favorited': get_flag(recipe, 'is_favorited', FAVORITES,
+                                     self.context),
+            'is_in_shopping_cart': get_flag(
+                recipe, 'is_in_shopping_cart', SHOPPING_CART, self.context),
+            'favorites_count': recipe.favorites_count,
+            'in_carts_count': recipe.in_carts_count,
+            'name': recipe.name,
+            'image': image,
+            'image_variants': variants,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+
+
+class FastSubscribeSerializer(FastSerializer):
+
+    def get_is_subscribed(self, author):
+        # Как SubscribeSerializer.get_is_subscribed: без ViewerState.
+        return get_flag(author, 'is_subscribed', SUBSCRIPTIONS,
+                        {'request': self.context['request']})
+
+    def get_recipes(self, author):
+        if hasattr(author, 'recipes_preview'):
+            recipes = author.recipes_preview
+        else:
+            limit = self.context['request'].query_params.get('recipes_limit')
+            recipes = (
+                author.recipes.all()[:int(limit)]
+                if limit is not None else author.recipes.all()
+            )
+        return FastRecipeShortSerializer(
+            recipes, many=True, context={'image_variant': 'thumb'}
+        ).data
+
+    def to_representation(self, author):
+        return {
+            'email': author.email,
+            'id': author.id,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'is_subscribed': self.get_is_subscribed(author),
+            'recipes': self.get_recipes(author),
+            'recipes_count': (
+                author.recipes_count if hasattr(author, 'recipes_count')
+                else author.recipes.count()
+            ),
+        }
+
+
+FAST_SERIALIZERS = {
+    RecipeReadSerializer: FastRecipeReadSerializer,
+    RecipeShortSerializer: FastRecipeShortSerializer,
+    SubscribeSerializer: FastSubscribeSerializer,
+}
+
+
+class FastSerializerMixin:
+    """Заменяет сериализаторы чтения на FAST_SERIALIZERS.
+
+    Включается для представления атрибутом fast_serializers, по
+    умолчанию — настройкой FAST_SERIALIZERS.
+    """
+    fast_serializers = settings.FAST_SERIALIZERS
+
+    def get_read_serializer_class(self, serializer_class):
+        if not self.fast_serializers:
+            return serializer_class
+        return FAST_SERIALIZERS.get(serializer_class, serializer_class)
+
+    def get_serializer_class(self):
+        return self.get_read_serializer_class(super().get_serializer_class())
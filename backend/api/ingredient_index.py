@@ -0,0 +1,65 @@
+import bisect
+import threading
+
+from recipes.models import Ingredient
+
+from .cache import INGREDIENTS, get_version
+
+# Символ, больший любой буквы: граница диапазона ключей с общим префиксом.
+PREFIX_END = '\U0010ffff'
+
+
+class IngredientIndex:
+    """Отсортированный индекс ингредиентов в памяти процесса.
+
+    Индекс помечен версией пространства имён INGREDIENTS из общего
+    кэша, той же, что у кэшированных ответов, и перестраивается, когда
+    она меняется. Ответ, сохранённый в кэше под новой версией, поэтому
+    построен по индексу не старше этой версии, в каком бы процессе ни
+    изменили ингредиенты.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _get_state(self):
+        version = get_version(INGREDIENTS)
+        state = self._state
+        if state is not None and state[0] == version:
+            return state
+        with self._lock:
+            state = self._state
+            if state is not None and state[0] == version:
+                return state
+            # Версия читается до запроса: если её поднимут во время
+            # построения, индекс перестроится при следующем поиске.
+            items = sorted(
+                Ingredient.objects.values('id', 'name', 'measurement_unit'),
+                key=lambda item: (item['name'].lower(), item['id'])
+            )
+            keys = [item['name'].lower() for item in items]
+            state = self._state = (version, keys, items)
+        return state
+
+    def search(self, query='', limit=None):
+        """Ингредиенты, чьё название начинается с query, а следом —
+        содержащие query, ближе к началу названия выше."""
+        _, keys, items = self._get_state()
+        query = query.lower()
+        if not query:
+            return items[:limit]
+        start = bisect.bisect_left(keys, query)
+        end = bisect.bisect_right(keys, query + PREFIX_END, lo=start)
+        found = items[start:end]
+        if limit is None or len(found) < limit:
+            contains = sorted(
+                (key.find(query), key, index)
+                for index, key in enumerate(keys)
+                if not start <= index < end and query in key
+            )
+            found += [items[index] for _, _, index in contains]
+        return found[:limit]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,346 @@
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from foodgram.db.pool import get_pool_stats
+
+from .authentication import token_cache
+from .cache import get_stats
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+current = ContextVar('request_metrics', default=None)
+
+
+class RequestStats:
+    """Запросы к БД и время этапов одного HTTP-запроса.
+
+    Объект вызывается из record_query вместо каждого SQL-запроса
+    и засекает его время.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0
+        self.queries = 0
+        self.db_time = 0
+        self.timings = defaultdict(float)
+        self.active = set()
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[IN_LIST.sub('(%s...)', sql)] += 1
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def duplicates(self, threshold):
+        """Одинаковые с точностью до параметров запросы — признак N+1."""
+        return {
+            sql: count for sql, count in self.statements.items()
+            if count >= threshold
+        }
+
+    def server_timing(self):
+        parts = [f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} SQL"']
+        parts += [
+            f'{name};dur={value * 1000:.1f}'
+            for name, value in self.timings.items()
+        ]
+        parts.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка execute_wrapper на каждом соединении (см. api.signals).
+
+    Соединения принадлежат потокам, а под ASGI представление выполняется
+    не в том потоке, что middleware, поэтому статистика запроса берётся
+    из контекста, который sync_to_async передаёт в поток.
+    """
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+@contextmanager
+def timer(name):
+    """Засекает этап запроса; вложенные замеры того же этапа
+    не суммируются повторно."""
+    stats = current.get()
+    if stats is None or name in stats.active:
+        yield
+        return
+    stats.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.timings[name] += time.perf_counter() - started
+        stats.active.discard(name)
+
+
+class TimedSerializerMixin:
+    """Время сериализации попадает в метрики запроса как serializer."""
+
+    def to_representation(self, instance):
+        with timer('serializer'):
+            return super().to_representation(instance)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+
+HISTOGRAMS = (
+    ('foodgram_request_duration_seconds', 'Время обработки запроса',
+     DURATION_BUCKETS, lambda stats: stats.total),
+    ('foodgram_request_db_seconds', 'Время SQL-запросов за запрос',
+     DURATION_BUCKETS, lambda stats: stats.db_time),
+    ('foodgram_request_serializer_seconds', 'Время сериализации за запрос',
+     DURATION_BUCKETS, lambda stats: stats.timings['serializer']),
+    ('foodgram_request_db_connect_seconds',
+     'Время получения соединения с БД за запрос',
+     DURATION_BUCKETS, lambda stats: stats.timings['db_connect']),
+    ('foodgram_request_queries', 'Число SQL-запросов за запрос',
+     QUERY_BUCKETS, lambda stats: stats.queries),
+)
+
+
+DB_CONNECTION_METRICS = (
+    ('foodgram_db_connections_opened_total', 'counter',
+     'Открытые соединения с БД', 'opened'),
+    ('foodgram_db_connections_acquired_total', 'counter',
+     'Полученные соединения с БД, новые и из пула', 'acquired'),
+    ('foodgram_db_connection_acquire_seconds_total', 'counter',
+     'Суммарное время получения соединений с БД', 'acquire_seconds'),
+    ('foodgram_db_health_check_failures_total', 'counter',
+     'Соединения, не прошедшие проверку перед использованием',
+     'health_check_failures'),
+    ('foodgram_db_pool_timeouts_total', 'counter',
+     'Ожидания свободного соединения пула, закончившиеся ошибкой',
+     'timeouts'),
+    ('foodgram_db_pool_idle_connections', 'gauge',
+     'Свободные соединения в пуле', 'idle'),
+    ('foodgram_db_pool_in_use_connections', 'gauge',
+     'Занятые соединения пула', 'in_use'),
+    ('foodgram_db_pool_max_connections', 'gauge',
+     'Размер пула', 'max_size'),
+)
+
+
+class Registry:
+    """Метрики по маршрутам в памяти процесса; каждый воркер отдаёт
+    свои значения."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.duplicates = Counter()
+        self.histograms = {
+            name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+            for name, _, buckets, _ in HISTOGRAMS
+        }
+
+    def observe(self, route, method, status, stats, duplicated):
+        with self.lock:
+            self.requests[route, method, status] += 1
+            if duplicated:
+                self.duplicates[route, method] += 1
+            for name, _, _, value in HISTOGRAMS:
+                self.histograms[name][route, method].observe(value(stats))
+
+    def render(self):
+        lines = [
+            '# HELP foodgram_requests_total Обработанные запросы',
+            '# TYPE foodgram_requests_total counter',
+        ]
+        with self.lock:
+            lines += [
+                f'foodgram_requests_total{{route="{route}",'
+                f'method="{method}",status="{status}"}} {count}'
+                for (route, method, status), count in self.requests.items()
+            ]
+            lines += [
+                '# HELP foodgram_duplicate_queries_total Запросы '
+                'с повторяющимися SQL (N+1)',
+                '# TYPE foodgram_duplicate_queries_total counter',
+            ]
+            lines += [
+                f'foodgram_duplicate_queries_total{{route="{route}",'
+                f'method="{method}"}} {count}'
+                for (route, method), count in self.duplicates.items()
+            ]
+            for name, description, _, _ in HISTOGRAMS:
+                lines += [f'# HELP {name} {description}',
+                          f'# TYPE {name} histogram']
+                for (route, method), histogram in (
+                        self.histograms[name].items()):
+                    lines += histogram.lines(
+                        name, f'route="{route}",method="{method}"')
+        lines += [
+            '# HELP foodgram_cache_requests_total Обращения к кэшу ответов',
+            '# TYPE foodgram_cache_requests_total counter',
+        ]
+        for namespace, events in get_stats().items():
+            lines += [
+                f'foodgram_cache_requests_total{{namespace="{namespace}",'
+                f'result="{event}"}} {count}'
+                for event, count in events.items()
+            ]
+        lines += [
+            '# HELP foodgram_auth_token_cache_total Проверки токенов '
+            'по уровню кэша',
+            '# TYPE foodgram_auth_token_cache_total counter',
+        ]
+        stats = token_cache.get_stats()
+        lines += [
+            f'foodgram_auth_token_cache_total{{result="{result}"}} '
+            f'{stats.get(event, 0)}'
+            for event, result in (('local_hits', 'local_hit'),
+                                  ('shared_hits', 'shared_hit'),
+                                  ('misses', 'miss'))
+        ]
+        lines += [
+            '# HELP foodgram_auth_token_cache_invalidations_total Сброшенные '
+            'записи кэша токенов',
+            '# TYPE foodgram_auth_token_cache_invalidations_total counter',
+            'foodgram_auth_token_cache_invalidations_total '
+            f'{stats.get("invalidations", 0)}',
+        ]
+        lines += self.render_connections()
+        return '\n'.join(lines) + '\n'
+
+    def render_connections(self):
+        lines = []
+        stats = get_pool_stats()
+        for name, kind, description, key in DB_CONNECTION_METRICS:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            lines += [
+                f'{name}{{database="{alias}"}} {values[key]}'
+                for alias, values in stats.items() if key in values
+            ]
+        return lines
+
+
+registry = Registry()
+
+
+class RequestMetricsMiddleware:
+    """Число и время SQL-запросов, время сериализации и общее время.
+
+    Отдаёт их в заголовке Server-Timing, пишет строкой JSON в лог
+    api.metrics и копит гистограммы по маршрутам для /api/metrics.
+    Если один и тот же SQL повторился не меньше SQL_DUPLICATE_THRESHOLD
+    раз, в лог пишется предупреждение о N+1. Запросы, выполняемые при
+    отдаче потокового ответа, не учитываются.
+
+    Работает и в синхронной, и в асинхронной цепочке middleware: под
+    ASGI запросы не проходят через общий поток sync_to_async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Как MiddlewareMixin: Django вызывает экземпляр как корутину.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.process_stats(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.process_stats(request, response, stats)
+
+    def process_stats(self, request, response, stats):
+        stats.finish()
+        match = request.resolver_match
+        route = match.view_name if match and match.view_name else 'unmatched'
+        duplicates = stats.duplicates(settings.SQL_DUPLICATE_THRESHOLD)
+        registry.observe(route, request.method, response.status_code, stats,
+                         bool(duplicates))
+        response['Server-Timing'] = stats.server_timing()
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'queries': stats.queries,
+            'db_ms': round(stats.db_time * 1000, 1),
+            'serializer_ms': round(stats.timings['serializer'] * 1000, 1),
+            'total_ms': round(stats.total * 1000, 1),
+            'duplicate_queries': sum(duplicates.values()),
+        }, ensure_ascii=False))
+        for sql, count in duplicates.items():
+            logger.warning('Возможный N+1 в %s %s: %s раз %s',
+                           request.method, route, count, sql)
+        return response
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus.
+
+    Доступны персоналу (сессия админки) и по заголовку Authorization:
+    Bearer с METRICS_TOKEN. Без токена в настройках остальным отвечает
+    404, как будто адреса нет.
+    """
+    token = settings.METRICS_TOKEN
+    if not request.user.is_staff and not (
+            token and constant_time_compare(
+                request.headers.get('Authorization', ''), f'Bearer {token}')):
+        if not token:
+            raise Http404
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
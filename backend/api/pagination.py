@@ -1,5 +1,248 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import BooleanField, F, Func, QuerySet, Value
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL без COUNT(*)."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def without_annotations(queryset):
+    """Копия queryset без аннотаций, которые не влияют на число строк.
+
+    Django 3.2 оставляет аннотации в COUNT(*) и считает по подзапросу
+    со всеми их выражениями. Аннотации-агрегаты меняют группировку и
+    остаются.
+    """
+    queryset = queryset.all()
+    query = queryset.query
+    for name, annotation in list(query.annotations.items()):
+        if not annotation.contains_aggregate:
+            del query.annotations[name]
+    return queryset
+
+
+class Row(Func):
+    """Конструктор строки (a, b) для сравнения кортежей."""
+    template = '(%(expressions)s)'
+
+    def __init__(self, *expressions):
+        super().__init__(*(
+            F(expression) if isinstance(expression, str) else expression
+            for expression in expressions
+        ))
+
+
+class RowComparison(Func):
+    """Сравнение строк (a, b) < (x, y) для PostgreSQL и SQLite."""
+    template = '%(expressions)s'
+    output_field = BooleanField()
+
+    def __init__(self, left, right, operator):
+        super().__init__(left, right)
+        self.arg_joiner = f' {operator} '
+
+
+class CountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return without_annotations(self.object_list).count()
+        return super().count
+
+
+class KeysetPagination(CursorPagination):
+    """Пагинация по курсору id: без OFFSET и без COUNT(*).
+
+    Сортировки из keyset_orderings сохраняются, любые другие
+    заменяются сортировкой по id. Для составной сортировки курсор
+    хранит значения всех её полей через запятую, а страница
+    отбирается сравнением кортежей: CursorPagination из DRF смотрит
+    только на первое поле и для повторяющихся значений уходит в OFFSET.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    keyset_orderings = {('-favorites_count', '-id')}
+    position_separator = ','
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        if len(self.ordering) == 1:
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor[1:]
+        if reverse:
+            queryset = queryset.order_by(*(
+                order[1:] if order.startswith('-') else f'-{order}'
+                for order in self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self.keyset_filter(
+                queryset.model, current_position, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering)
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+        self.display_page_controls = self.has_previous or self.has_next
+        return self.page
+
+    def keyset_filter(self, model, position, reverse):
+        """Условие «строка после курсора»: (a, b) < (x, y) или >.
+
+        Все поля сортировки из keyset_orderings идут в одном
+        направлении, поэтому сравнение строк совпадает с порядком
+        индекса и целиком попадает в его условие.
+        """
+        values = position.split(self.position_separator)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        names = [order.lstrip('-') for order in self.ordering]
+        try:
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(names, values)
+            ]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        descending = self.ordering[0].startswith('-') != reverse
+        return RowComparison(
+            Row(*names), Row(*map(Value, values)),
+            operator='<' if descending else '>')
+
+    def _get_position_from_instance(self, instance, ordering):
+        if len(ordering) == 1:
+            return super()._get_position_from_instance(instance, ordering)
+        return self.position_separator.join(
+            str(instance[order.lstrip('-')] if isinstance(instance, dict)
+                else getattr(instance, order.lstrip('-')))
+            for order in ordering
+        )
+
+    def get_ordering(self, request, queryset, view):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        if tuple(ordering) in self.keyset_orderings:
+            return tuple(ordering)
+        if ordering and ordering[0] in ('id', 'pk'):
+            return ('id',)
+        return ('-id',)
+
+
+class FeedPagination(KeysetPagination):
+    """Keyset по убыванию id для страниц, собранных не из queryset.
+
+    paginate_ids() получает id страницы от get_ids(before, limit);
+    курсор хранит последний отданный id. Ссылки назад нет.
+    """
+
+    def paginate_ids(self, get_ids, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        before = None
+        if cursor is not None and cursor.position is not None:
+            if not cursor.position.isdigit():
+                raise NotFound(self.invalid_cursor_message)
+            before = int(cursor.position)
+        ids = get_ids(before, self.page_size + 1)
+        self.has_next = len(ids) > self.page_size
+        ids = ids[:self.page_size]
+        self.next_position = ids[-1] if ids else None
+        return ids
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False, position=str(self.next_position)))
+
+    def get_previous_link(self):
+        return None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничная пагинация page/limit.
+
+    С параметром cursor (в том числе пустым — первая страница)
+    переключается на KeysetPagination. Параметр count=exact или
+    count=estimate добавляет в такой ответ точное или оценочное
+    число объектов.
+    """
+    django_paginator_class = CountPaginator
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPagination()
+        count = request.query_params.get(self.count_query_param)
+        if count == 'exact':
+            self.count = without_annotations(queryset).count()
+        elif count == 'estimate':
+            self.count = estimate_count(without_annotations(queryset))
+        else:
+            self.count = None
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.keyset.get_next_link()
+        response['previous'] = self.keyset.get_previous_link()
+        response['results'] = data
+        return Response(response)
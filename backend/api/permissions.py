@@ -3,9 +3,10 @@ from rest_framework import permissions
 
 class IsAuthorAdminOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return (
+        return request.method in permissions.SAFE_METHODS or (
             request.user.is_authenticated and (
-                request.user.is_superuser or obj.author == request.user
+                request.user.is_superuser
+                or obj.author_id == request.user.id
                 or request.method == 'POST'
             )
-        ) or request.method in permissions.SAFE_METHODS
+        )
@@ -1,16 +1,25 @@
 import re
 
+from django.conf import settings
 from django.db import transaction
-from django.db.models import F
-from django.shortcuts import get_object_or_404
+from django.db.models import Manager
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
-from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes.images import get_variant_urls, schedule_image_variants
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCartLine, Tag)
+from recipes.search import update_search_index
 from rest_framework.exceptions import ValidationError
-from rest_framework.fields import IntegerField, SerializerMethodField
+from rest_framework.fields import (ImageField, IntegerField, ListField,
+                                   SerializerMethodField)
 from rest_framework.relations import PrimaryKeyRelatedField
-from rest_framework.serializers import ModelSerializer
-from users.models import Subscribe, User
+from rest_framework.serializers import (ListSerializer, ModelSerializer,
+                                        Serializer)
+from users.models import User
+
+from .metrics import TimedSerializerMixin
+from .viewer_state import (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS, get_flag,
+                           prime_recipes, prime_users)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -19,29 +28,63 @@ class CustomUserCreateSerializer(UserCreateSerializer):
                   'first_name', 'last_name', 'password')
 
 
-class CustomUserSerializer(UserSerializer):
+class ViewerStateListSerializer(TimedSerializerMixin, ListSerializer):
+    """Перед сериализацией списка проверяет состояние пользователя
+    для всех объектов страницы разом."""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, Manager) else data)
+        viewer = self.context.get('viewer')
+        if viewer is not None:
+            self.child.prime_viewer_state(viewer, items)
+        return [self.child.to_representation(item) for item in items]
+
+
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return (not user.is_anonymous
-                and Subscribe.objects.filter(user=user, author=obj).exists())
+        return get_flag(obj, 'is_subscribed', SUBSCRIPTIONS, self.context)
+
+    def prime_viewer_state(self, viewer, users):
+        prime_users(viewer, users)
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username',
                   'first_name', 'last_name', 'is_subscribed', )
+        list_serializer_class = ViewerStateListSerializer
 
 
-class SubscriptionsRecipeSerializer(ModelSerializer):
-    image = Base64ImageField()
+class ImageVariantsMixin:
+    """Добавляет адреса уменьшенных копий изображения рецепта.
+
+    Если в контексте задан image_variant и такая копия готова,
+    поле image указывает на неё вместо оригинала.
+    """
+
+    def get_image_variants(self, obj):
+        return get_variant_urls(obj, self.context.get('request'))
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        variant = data['image_variants'].get(
+            self.context.get('image_variant'))
+        if variant is not None:
+            data['image'] = variant['url']
+        return data
+
+
+class SubscriptionsRecipeSerializer(ImageVariantsMixin, ModelSerializer):
+    image = ImageField(read_only=True)
+    image_variants = SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
-class SubscribeSerializer(ModelSerializer):
+class SubscribeSerializer(TimedSerializerMixin, ModelSerializer):
     is_subscribed = SerializerMethodField()
     recipes = SerializerMethodField()
     recipes_count = SerializerMethodField()
@@ -52,39 +95,48 @@ class SubscribeSerializer(ModelSerializer):
                   'is_subscribed', 'recipes', 'recipes_count', )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return (not user.is_anonymous
-                and Subscribe.objects.filter(user=user, author=obj).exists())
+        # Без ViewerState: подписки обычно уже в аннотации is_subscribed.
+        return get_flag(obj, 'is_subscribed', SUBSCRIPTIONS,
+                        {'request': self.context['request']})
 
     def get_recipes(self, obj):
-        limit = self.context['request'].query_params.get('recipes_limit')
-        recipes = (
-            obj.recipes.all()[:int(limit)]
-            if limit is not None else obj.recipes.all()
-        )
-        return SubscriptionsRecipeSerializer(recipes, many=True).data
+        if hasattr(obj, 'recipes_preview'):
+            recipes = obj.recipes_preview
+        else:
+            limit = self.context['request'].query_params.get('recipes_limit')
+            recipes = (
+                obj.recipes.all()[:int(limit)]
+                if limit is not None else obj.recipes.all()
+            )
+        return SubscriptionsRecipeSerializer(
+            recipes, many=True, context={'image_variant': 'thumb'}
+        ).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, ModelSerializer):
     class Meta:
         model = Ingredient
         fields = '__all__'
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedSerializerMixin, ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class RecipeReadSerializer(ModelSerializer):
+class RecipeReadSerializer(TimedSerializerMixin, ImageVariantsMixin,
+                           ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = SerializerMethodField()
-    image = Base64ImageField()
+    image = ImageField(read_only=True)
+    image_variants = SerializerMethodField()
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
 
@@ -97,33 +149,36 @@ class RecipeReadSerializer(ModelSerializer):
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
+            'favorites_count',
+            'in_carts_count',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
+        list_serializer_class = ViewerStateListSerializer
 
     def get_ingredients(self, obj):
-        recipe = obj
-        ingredients = recipe.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredientinrecipe__amount')
-        )
-        return ingredients
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in obj.ingredient_list.all()
+        ]
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return user.favorites.filter(recipe=obj).exists()
+        return get_flag(obj, 'is_favorited', FAVORITES, self.context)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return user.shopping_cart.filter(recipe=obj).exists()
+        return get_flag(obj, 'is_in_shopping_cart', SHOPPING_CART,
+                        self.context)
+
+    def prime_viewer_state(self, viewer, recipes):
+        prime_recipes(viewer, recipes)
 
 
 class IngredientInRecipeWriteSerializer(ModelSerializer):
@@ -155,30 +210,25 @@ class RecipeWriteSerializer(ModelSerializer):
         )
 
     def validate_ingredients(self, value):
-        ingredients = value
-        if not ingredients:
+        if not value:
             raise ValidationError('Ингредиентов не может быть меньше 1')
-
-        ingredients_list = []
-        for item in ingredients:
-            ingredient = get_object_or_404(Ingredient, id=item['id'])
-            if ingredient in ingredients_list:
-                raise ValidationError('Ингридиенты не могут повторяться!')
-            if int(item['amount']) <= 0:
-                raise ValidationError('Количество ингредиента'
-                                      ' должно быть больше 0!')
-            ingredients_list.append(ingredient)
+        ids = [item['id'] for item in value]
+        if len(set(ids)) != len(ids):
+            raise ValidationError('Ингридиенты не могут повторяться!')
+        missing = set(ids) - Ingredient.objects.in_bulk(ids).keys()
+        if missing:
+            raise ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing)}')
+        if any(int(item['amount']) <= 0 for item in value):
+            raise ValidationError('Количество ингредиента'
+                                  ' должно быть больше 0!')
         return value
 
     def validate_tags(self, value):
-        tags = value
-        if not tags:
+        if not value:
             raise ValidationError('Нужно выбрать хотя бы один тег!')
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise ValidationError('Теги должны быть уникальными!')
-            tags_list.append(tag)
+        if len(set(value)) != len(value):
+            raise ValidationError('Теги должны быть уникальными!')
         return value
 
     def validate_name(self, value):
@@ -187,14 +237,37 @@ class RecipeWriteSerializer(ModelSerializer):
                                   ' состоять только из цифр или знаков.')
         return value
 
-    @transaction.atomic
-    def create_ingredients_amounts(self, ingredients, recipe):
-        IngredientInRecipe.objects.bulk_create(
-            [IngredientInRecipe(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
-                recipe=recipe,
-                amount=ingredient['amount']
-            ) for ingredient in ingredients]
+    def set_ingredients(self, recipe, ingredients, created=False):
+        """Приводит ингредиенты рецепта к списку ingredients, меняя только
+        отличающиеся строки. Возвращает id затронутых ингредиентов."""
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        current = {} if created else {
+            row.ingredient_id: row
+            for row in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        to_delete = [
+            row.pk for ingredient_id, row in current.items()
+            if ingredient_id not in amounts
+        ]
+        to_update = []
+        for ingredient_id, row in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                to_update.append(row)
+        to_create = [
+            IngredientInRecipe(recipe=recipe, ingredient_id=ingredient_id,
+                               amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        if to_delete:
+            IngredientInRecipe.objects.filter(pk__in=to_delete).delete()
+        IngredientInRecipe.objects.bulk_update(to_update, ['amount'])
+        IngredientInRecipe.objects.bulk_create(to_create)
+        return (
+            {row.ingredient_id for row in to_update + to_create}
+            | (current.keys() - amounts.keys())
         )
 
     @transaction.atomic
@@ -202,35 +275,53 @@ class RecipeWriteSerializer(ModelSerializer):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         self.validate_name(validated_data.get('name', ''))
-        recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe(**validated_data)
+        recipe.save(update_index=False)
         recipe.tags.set(tags)
-        self.create_ingredients_amounts(recipe=recipe,
-                                        ingredients=ingredients)
+        self.set_ingredients(recipe, ingredients, created=True)
+        update_search_index([recipe.pk])
+        schedule_image_variants(recipe)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
         self.validate_name(validated_data.get('name', ''))
-        instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients_amounts(recipe=instance,
-                                        ingredients=ingredients)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if tags is not None:
+            instance.tags.set(tags)
+        changed = set()
+        if ingredients is not None:
+            changed = self.set_ingredients(instance, ingredients)
+        # Поисковый индекс обновляется в save() уже с новыми ингредиентами.
         instance.save()
+        if 'image' in validated_data:
+            schedule_image_variants(instance)
+        if changed:
+            users = list(instance.shopping_cart.values_list(
+                'user', flat=True))
+            if users:
+                ShoppingCartLine.objects.rebuild(users, changed)
         return instance
 
     def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {'request': request}
-        return RecipeReadSerializer(instance,
-                                    context=context).data
-
-
-class RecipeShortSerializer(ModelSerializer):
-    image = Base64ImageField()
+        view = self.context.get('view')
+        serializer_class = RecipeReadSerializer
+        if view is not None:
+            # Ответ собирается с теми же prefetch, что и при чтении,
+            # иначе каждый ингредиент загружается отдельным запросом.
+            instance = view.get_queryset().get(pk=instance.pk)
+            serializer_class = view.get_read_serializer_class(
+                RecipeReadSerializer)
+        return serializer_class(instance, context=self.context).data
+
+
+class RecipeShortSerializer(TimedSerializerMixin, ImageVariantsMixin,
+                            ModelSerializer):
+    image = ImageField(read_only=True)
+    image_variants = SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -238,5 +329,14 @@ class RecipeShortSerializer(ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
+
+
+class RecipeIdsSerializer(Serializer):
+    recipes = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT,
+    )
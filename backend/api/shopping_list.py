@@ -0,0 +1,99 @@
+import csv
+import hashlib
+import json
+
+from django.db.models import F
+from recipes.models import ShoppingCartLine
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.settings import APISettings
+
+CHUNK_SIZE = 500
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """Параметр format выбирает формат файла, а не рендерер DRF."""
+    settings = APISettings({'URL_FORMAT_OVERRIDE': None})
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: отдаёт строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def get_ingredients(user):
+    return ShoppingCartLine.objects.filter(user=user).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        amount=F('total_amount'),
+    ).order_by('ingredient__name')
+
+
+def get_etag(user, file_format, today):
+    """ETag по строкам файла: названия, единицы измерения и количества
+    ингредиентов в том порядке, в каком они попадут в список."""
+    digest = hashlib.md5(
+        f'{user.pk}:{user.get_full_name()}:{file_format}:{today:%Y-%m-%d}'
+        .encode())
+    rows = get_ingredients(user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount')
+    for name, unit, amount in rows.iterator(chunk_size=CHUNK_SIZE):
+        digest.update(json.dumps(
+            [name, unit, str(amount)], ensure_ascii=False).encode())
+    return digest.hexdigest()
+
+
+def render_txt(user, rows, today):
+    yield (
+        f'Список покупок для: {user.get_full_name()}\n\n'
+        f'Дата: {today:%Y-%m-%d}\n\n'
+    )
+    separator = ''
+    for ingredient in rows:
+        yield (
+            f'{separator}- {ingredient["ingredient__name"]} '
+            f'({ingredient["ingredient__measurement_unit"]})'
+            f' - {ingredient["amount"]}'
+        )
+        separator = '\n'
+    yield f'\n\nFoodgram ({today:%Y})'
+
+
+def render_csv(user, rows, today):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in rows:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+def render_json(user, rows, today):
+    yield (
+        '{"user": ' + json.dumps(user.get_full_name(), ensure_ascii=False)
+        + ', "date": ' + json.dumps(f'{today:%Y-%m-%d}')
+        + ', "ingredients": ['
+    )
+    for index, ingredient in enumerate(rows):
+        yield (', ' if index else '') + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        }, ensure_ascii=False)
+    yield ']}'
+
+
+FORMATS = {
+    'txt': ('text/plain', render_txt),
+    'csv': ('text/csv', render_csv),
+    'json': ('application/json', render_json),
+}
+
+
+def stream_shopping_list(user, file_format, today):
+    """Генератор файла списка покупок в выбранном формате."""
+    rows = get_ingredients(user).iterator(chunk_size=CHUNK_SIZE)
+    return FORMATS[file_format][1](user, rows, today)
@@ -0,0 +1,95 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCartLine, Tag, counters_changed)
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from .authentication import token_cache
+from .cache import INGREDIENTS, RECIPES, TAGS, bump_version
+from .metrics import record_query
+
+CACHE_NAMESPACES = {
+    Tag: (TAGS, RECIPES),
+    Ingredient: (INGREDIENTS, RECIPES),
+    Recipe: (RECIPES,),
+    Recipe.tags.through: (RECIPES,),
+    IngredientInRecipe: (RECIPES,),
+    User: (RECIPES,),
+}
+# Через какое поле рецепта связанный объект попадает в ответ о рецепте.
+RECIPE_LOOKUPS = {
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+    User: 'author',
+}
+
+
+@receiver(connection_created)
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    transaction.on_commit(partial(token_cache.invalidate, instance.key))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, update_fields=None, **kwargs):
+    # Смена пароля, деактивация и правка профиля: в кэше токенов не
+    # должно остаться прежнего пользователя.
+    if update_fields == {'last_login'}:
+        return
+    transaction.on_commit(partial(token_cache.invalidate_user, instance.pk))
+
+
+@receiver((post_save, pre_delete))
+def touch_recipes(sender, instance, created=False, update_fields=None,
+                  **kwargs):
+    # Переименование тега или ингредиента и правка профиля автора
+    # меняют ответы о рецептах, поэтому меняется и их updated_at.
+    lookup = RECIPE_LOOKUPS.get(sender)
+    if lookup is None or created or update_fields == {'last_login'}:
+        return
+    Recipe.objects.filter(**{lookup: instance}).touch()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_cart_lines(instance, **kwargs):
+    # Корзины и ингредиенты рецепта удаляются каскадом, поэтому
+    # затронутые строки списков покупок запоминаются заранее.
+    instance.cart_lines = (
+        list(instance.shopping_cart.values_list('user', flat=True)),
+        list(instance.ingredient_list.values_list('ingredient', flat=True)),
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def rebuild_cart_lines(instance, **kwargs):
+    users, ingredients = getattr(instance, 'cart_lines', ((), ()))
+    if users:
+        ShoppingCartLine.objects.rebuild(users, ingredients)
+
+
+@receiver((post_save, post_delete, m2m_changed))
+def invalidate_api_cache(sender, **kwargs):
+    namespaces = CACHE_NAMESPACES.get(sender)
+    if namespaces is None:
+        return
+    if not kwargs.get('action', 'post_').startswith('post_'):
+        return
+    if kwargs.get('update_fields') == {'last_login'}:
+        return
+    transaction.on_commit(partial(bump_version, *namespaces))
+
+
+@receiver(counters_changed, sender=Recipe)
+def invalidate_recipe_counters(**kwargs):
+    transaction.on_commit(partial(bump_version, RECIPES))
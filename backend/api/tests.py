@@ -0,0 +1,539 @@
+import shutil
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from recipes.feed import schedule_fan_out
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            ShoppingCartLine, Tag)
+from recipes.search import is_postgres
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from users.models import Subscribe, User
+
+from .authentication import TokenCache
+from .cache import INGREDIENTS, bump_version
+from .fast_serializers import FAST_SERIALIZERS
+from .ingredient_index import IngredientIndex
+from .serializers import (RecipeReadSerializer, RecipeShortSerializer,
+                          SubscribeSerializer)
+from .views import CustomUserViewSet, RecipeViewSet
+
+
+def create_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com', username=name, first_name=name,
+        last_name=name, password='test-password')
+
+
+def create_recipes(authors, count):
+    tags = [
+        Tag.objects.create(name=f'Тег {index}', color=f'#00000{index}',
+                           slug=f'tag{index}')
+        for index in range(3)
+    ]
+    ingredients = [
+        Ingredient.objects.create(name=f'Ингредиент {index}',
+                                  measurement_unit='г')
+        for index in range(5)
+    ]
+    recipes = []
+    for index in range(count):
+        recipe = Recipe.objects.create(
+            name=f'Рецепт {index}', author=authors[index % len(authors)],
+            text='Описание', image='recipes/test.png', cooking_time=10)
+        recipe.tags.set(tags[:index % 3 + 1])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=index + 1)
+            for ingredient in ingredients[:index % 5 + 1]
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        authors = [create_user(f'author{index}') for index in range(5)]
+        Subscribe.objects.create(user=cls.user, author=authors[0])
+        create_recipes(authors, 60)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        # COUNT(*), страница рецептов и prefetch авторов, тегов
+        # и ингредиентов.
+        for limit in (5, 50):
+            with self.subTest(limit=limit), self.assertNumQueries(5):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(len(response.data['results']), limit)
+
+
+class RecipeCacheTest(TestCase):
+    """Кэш анонимных ответов о рецептах сбрасывается вместе со счётчиками."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.recipe, = create_recipes([create_user('author')], 1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_favorites_count(self, url):
+        response = self.client.get(url)
+        return response['X-Cache'], response.data['results'][0][
+            'favorites_count']
+
+    def test_favorite_changes_cached_list(self):
+        user_client = APIClient()
+        user_client.force_authenticate(self.user)
+        for url in ('/api/recipes/?limit=6',
+                    '/api/recipes/?limit=6&ordering=popular'):
+            with self.subTest(url=url):
+                self.assertEqual(self.get_favorites_count(url),
+                                 ('MISS', 0))
+                self.assertEqual(self.get_favorites_count(url), ('HIT', 0))
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = user_client.post(
+                        f'/api/recipes/{self.recipe.id}/favorite/')
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(self.get_favorites_count(url),
+                                 ('MISS', 1))
+                with self.captureOnCommitCallbacks(execute=True):
+                    user_client.delete(
+                        f'/api/recipes/{self.recipe.id}/favorite/')
+
+
+class ShoppingListETagTest(TestCase):
+    """ETag списка покупок меняется вместе с содержимым файла."""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        recipe, = create_recipes([create_user('author')], 1)
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        ShoppingCartLine.objects.add_recipe(cls.user, recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_ingredient_rename_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Ingredient.objects.filter(name='Ингредиент 0').update(
+            name='Мука', measurement_unit='кг')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Мука (кг)', b''.join(
+            response.streaming_content).decode())
+
+
+class MetricsViewTest(TestCase):
+    """Доступ к /api/metrics/: персонал, токен, иначе 403 или 404."""
+
+    url = '/api/metrics/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.staff = create_user('staff')
+        cls.staff.is_staff = True
+        cls.staff.save()
+
+    def get(self, user=None, token=None):
+        if user is not None:
+            self.client.force_login(user)
+        headers = {}
+        if token is not None:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        return self.client.get(self.url, **headers).status_code
+
+    @override_settings(METRICS_TOKEN='')
+    def test_without_token_setting(self):
+        self.assertEqual(self.get(), 404)
+        self.assertEqual(self.get(token=''), 404)
+        self.assertEqual(self.get(self.user), 404)
+        self.assertEqual(self.get(self.staff), 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_with_token_setting(self):
+        self.assertEqual(self.get(), 403)
+        self.assertEqual(self.get(token='wrong'), 403)
+        self.assertEqual(self.get(token='secret'), 200)
+        self.assertEqual(self.get(self.user), 403)
+        self.assertEqual(self.get(self.staff), 200)
+
+
+class TokenCacheTest(TestCase):
+    """Кэш токенов: только с общим кэшем, копии пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+
+    def make_cache(self):
+        return TokenCache(size=10, local_ttl=30, shared_ttl=300)
+
+    def test_disabled_with_locmem(self):
+        tokens = self.make_cache()
+        tokens.set('key', self.user)
+        self.assertIsNone(tokens.get('key'))
+        self.assertEqual(tokens.get_stats(), {})
+
+    def test_shared_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory,
+        }}
+        with override_settings(CACHES=shared):
+            tokens, other_worker = self.make_cache(), self.make_cache()
+            tokens.set('key', self.user)
+            first, second = tokens.get('key'), tokens.get('key')
+            self.assertEqual(first, self.user)
+            self.assertIsNot(first, second)
+            self.assertEqual(other_worker.get('key'), self.user)
+            tokens.invalidate('key')
+            self.assertIsNone(tokens.get('key'))
+            self.assertEqual(tokens.get_stats(), {
+                'local_hits': 2, 'invalidations': 1, 'misses': 1})
+            self.assertEqual(other_worker.get_stats(), {'shared_hits': 1})
+
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNo'
+    'AAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+MEDIA_ROOT = tempfile.mkdtemp()
+# PostgreSQL обновляет search_vector одним UPDATE, SQLite — DELETE
+# и INSERT в таблице FTS.
+SEARCH_INDEX_QUERIES = 1 if is_postgres('default') else 2
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteQueriesTest(TestCase):
+    """Число запросов записи рецепта не зависит от числа ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('cook')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {index}', color=f'#00000{index}',
+                               slug=f'tag{index}')
+            for index in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(40)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def payload(self, ingredients, amount=1):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': IMAGE,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient in ingredients
+            ],
+        }
+
+    def create_recipe(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(self.ingredients[:30]),
+            format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def test_create_with_30_ingredients(self):
+        # Теги проверяются по одному, ингредиенты — одним запросом;
+        # строки IngredientInRecipe вставляются одним bulk_create.
+        with self.assertNumQueries(19 + SEARCH_INDEX_QUERIES):
+            recipe_id = self.create_recipe()
+        self.assertEqual(
+            IngredientInRecipe.objects.filter(recipe=recipe_id).count(), 30)
+
+    def test_partial_ingredient_change(self):
+        recipe_id = self.create_recipe()
+        # 25 прежних ингредиентов (5 с новым количеством) и 5 новых.
+        ingredients = [
+            {'id': ingredient.id, 'amount': 2 if index < 5 else 1}
+            for index, ingredient in enumerate(self.ingredients[5:35])
+        ]
+        # По одному DELETE, UPDATE и INSERT на все изменённые строки.
+        with self.assertNumQueries(18 + SEARCH_INDEX_QUERIES):
+            response = self.client.patch(
+                f'/api/recipes/{recipe_id}/',
+                {'ingredients': ingredients}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            sorted(IngredientInRecipe.objects.filter(
+                recipe=recipe_id).values_list('ingredient', flat=True)),
+            [ingredient.id for ingredient in self.ingredients[5:35]])
+
+    def test_noop_update(self):
+        recipe_id = self.create_recipe()
+        payload = self.payload(self.ingredients[:30])
+        del payload['image']
+        with self.assertNumQueries(17 + SEARCH_INDEX_QUERIES):
+            response = self.client.patch(
+                f'/api/recipes/{recipe_id}/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+
+def make_view(viewset, user, action, params=None):
+    """Представление с запросом от имени user, как его создаёт DRF."""
+    request = Request(RequestFactory().get('/', params))
+    request.user = user
+    return viewset(request=request, action=action, format_kwarg=None,
+                   kwargs={})
+
+
+def contract_cases(user, limit):
+    """Название, сериализатор DRF, объекты, many и контекст.
+
+    Объекты готовятся так же, как в представлениях, а также без
+    аннотаций и prefetch, чтобы проверить запасные пути.
+    """
+    view = make_view(RecipeViewSet, user, 'list')
+    context = view.get_serializer_context()
+    recipes = list(view.get_queryset()[:limit])
+    plain_recipes = list(Recipe.objects.all()[:limit])
+    yield 'recipes_list', RecipeReadSerializer, recipes, True, context
+    yield 'recipes_plain', RecipeReadSerializer, plain_recipes, True, context
+    view = make_view(RecipeViewSet, user, 'retrieve')
+    yield ('recipe_detail', RecipeReadSerializer, recipes[0], False,
+           view.get_serializer_context())
+    yield 'recipe_short', RecipeShortSerializer, plain_recipes[0], False, {}
+    if user.is_anonymous:
+        return
+    view = make_view(CustomUserViewSet, user, 'subscriptions',
+                     {'recipes_limit': 3})
+    context = view.get_serializer_context()
+    authors = list(view.get_subscriptions_queryset()[:limit])
+    view.prefetch_recipes_preview(authors)
+    yield 'subscriptions', SubscribeSerializer, authors, True, context
+    author = User.objects.get(pk=authors[0].pk)
+    yield 'subscribe', SubscribeSerializer, author, False, context
+
+
+class SerializerContractTest(TestCase):
+    """Быстрые сериализаторы чтения отдают тот же JSON, что и DRF."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        authors = [create_user(f'author{index}') for index in range(3)]
+        for author in authors[:2]:
+            Subscribe.objects.create(user=cls.user, author=author)
+        recipes = create_recipes(authors, 12)
+        for recipe in recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in recipes[::3]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def test_fast_serializers_match_drf(self):
+        render = JSONRenderer().render
+        for user in (AnonymousUser(), self.user):
+            for name, serializer_class, instance, many, context in (
+                    contract_cases(user, limit=20)):
+                with self.subTest(case=name, user=str(user)):
+                    expected = serializer_class(
+                        instance, many=many, context=context).data
+                    actual = FAST_SERIALIZERS[serializer_class](
+                        instance, many=many, context=context).data
+                    self.assertEqual(render(actual).decode(),
+                                     render(expected).decode())
+
+
+class FeedTest(TestCase):
+    """Лента подписок: рассылка, отписка, чтение у автора и курсор."""
+
+    url = '/api/recipes/feed/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        cls.author = create_user('author')
+        cls.other = create_user('other')
+        create_recipes([cls.author, cls.other], 4)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def subscribe(self, author):
+        response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+
+    def publish(self, author):
+        recipe = Recipe.objects.create(
+            name='Новый рецепт', author=author, text='Описание',
+            image='recipes/test.png', cooking_time=5)
+        schedule_fan_out(recipe)
+        recipe.refresh_from_db()
+        return recipe
+
+    def walk(self, limit):
+        ids, url = [], f'{self.url}?limit={limit}'
+        while url:
+            data = self.client.get(url).data
+            self.assertLessEqual(len(data['results']), limit)
+            ids += [recipe['id'] for recipe in data['results']]
+            url = data['next']
+        return ids
+
+    def expected(self, *authors):
+        return list(Recipe.objects.filter(author__in=authors).order_by(
+            '-id').values_list('id', flat=True))
+
+    def test_follow_backfills_feed(self):
+        self.subscribe(self.author)
+        self.assertEqual(
+            sorted(FeedEntry.objects.filter(user=self.reader).values_list(
+                'recipe', flat=True)),
+            sorted(self.expected(self.author)))
+        self.assertEqual(self.walk(limit=6), self.expected(self.author))
+
+    def test_new_recipe_is_fanned_out(self):
+        self.subscribe(self.author)
+        recipe = self.publish(self.author)
+        self.assertTrue(recipe.fanned_out)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, recipe=recipe).exists())
+        self.assertEqual(self.walk(limit=6)[0], recipe.id)
+
+    def test_popular_author_is_read_on_pull(self):
+        self.subscribe(self.author)
+        with override_settings(FEED_PULL_FOLLOWERS=1):
+            recipe = self.publish(self.author)
+        self.assertFalse(recipe.fanned_out)
+        self.assertFalse(FeedEntry.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.walk(limit=6)[0], recipe.id)
+
+    def test_unfollow_removes_entries(self):
+        self.subscribe(self.author)
+        self.subscribe(self.other)
+        self.publish(self.author)
+        response = self.client.delete(
+            f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.reader, recipe__author=self.author).exists())
+        self.assertEqual(self.walk(limit=6), self.expected(self.other))
+
+    def test_entry_fanned_out_after_unfollow_is_hidden(self):
+        # Фоновая рассылка прочитала подписчиков до отписки.
+        self.subscribe(self.other)
+        FeedEntry.objects.create(
+            user=self.reader,
+            recipe=Recipe.objects.filter(author=self.author).first())
+        self.assertEqual(self.walk(limit=6), self.expected(self.other))
+
+    def test_cursor_pages(self):
+        self.subscribe(self.author)
+        self.subscribe(self.other)
+        with override_settings(FEED_PULL_FOLLOWERS=1):
+            self.publish(self.other)
+        self.publish(self.author)
+        expected = self.expected(self.author, self.other)
+        for limit in (1, 2, 4, 10):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.walk(limit), expected)
+        response = self.client.get(f'{self.url}?cursor=zzz')
+        self.assertEqual(response.status_code, 404)
+
+
+class ImportDataCacheTest(TestCase):
+    """import_data сбрасывает кэш ответов и индекс ингредиентов."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.directory = directory
+
+    def import_data(self, model, content):
+        path = f'{self.directory}/{model}.csv'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        call_command('import_data', model, path)
+
+    def test_ingredients(self):
+        self.import_data('ingredients', 'мука,г\n')
+        url = '/api/ingredients/?name=м'
+        self.assertEqual(len(self.client.get(url).data), 1)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        self.import_data('ingredients', 'молоко,мл\n')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([item['name'] for item in response.data],
+                         ['молоко', 'мука'])
+
+    def test_tags(self):
+        self.import_data('tags', 'Завтрак,#E26C2D,breakfast\n')
+        recipe, = create_recipes([create_user('author')], 1)
+        recipe.tags.set(Tag.objects.filter(slug='breakfast'))
+        updated_at = Recipe.objects.get(pk=recipe.pk).updated_at
+        self.client.get('/api/tags/')
+        self.import_data('tags', 'Утро,#E26C2D,breakfast\n')
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn({'name': 'Утро', 'slug': 'breakfast'}, [
+            {'name': tag['name'], 'slug': tag['slug']}
+            for tag in response.data
+        ])
+        self.assertGreater(Recipe.objects.get(pk=recipe.pk).updated_at,
+                           updated_at)
+
+
+class IngredientIndexTest(TestCase):
+    """Индекс ингредиентов следует версии INGREDIENTS в общем кэше."""
+
+    def test_rebuilt_on_version_change(self):
+        ingredient = Ingredient.objects.create(name='мука',
+                                               measurement_unit='г')
+        index = IngredientIndex()
+        self.assertEqual(len(index.search('мук')), 1)
+        # Изменение в другом процессе: сигналы здесь не срабатывают,
+        # видна только новая версия в общем кэше.
+        Ingredient.objects.filter(pk=ingredient.pk).update(name='мёд')
+        self.assertEqual(len(index.search('мук')), 1)
+        bump_version(INGREDIENTS)
+        self.assertEqual(index.search('мук'), [])
+        self.assertEqual([item['name'] for item in index.search('мё')],
+                         ['мёд'])
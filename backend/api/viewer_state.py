@@ -0,0 +1,131 @@
+from django.conf import settings
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscribe
+
+FAVORITES = 'favorites'
+SHOPPING_CART = 'shopping_cart'
+SUBSCRIPTIONS = 'subscriptions'
+
+SOURCES = {
+    FAVORITES: (Favorite, 'recipe_id'),
+    SHOPPING_CART: (ShoppingCart, 'recipe_id'),
+    SUBSCRIPTIONS: (Subscribe, 'author_id'),
+}
+
+
+class ViewerState:
+    """Избранное, корзина и подписки текущего пользователя.
+
+    Каждый набор id загружается одним запросом при первом обращении.
+    Если в наборе больше cap элементов, он не загружается целиком:
+    вместо этого prime() проверяет пачку id одним запросом IN (...).
+    """
+
+    def __init__(self, user, cap=None):
+        self.user = user
+        self.cap = settings.VIEWER_STATE_CAP if cap is None else cap
+        self._ids = {}
+        self._complete = {}
+        self._checked = {}
+
+    @classmethod
+    def for_request(cls, request):
+        """Одно состояние на запрос, общее для всех сериализаторов."""
+        request = getattr(request, '_request', request)
+        if not hasattr(request, 'viewer_state'):
+            request.viewer_state = cls(request.user)
+        return request.viewer_state
+
+    def _query(self, kind):
+        model, field = SOURCES[kind]
+        return model.objects.filter(user=self.user).values_list(
+            field, flat=True)
+
+    def _load(self, kind):
+        if kind in self._ids:
+            return
+        ids = set(self._query(kind)[:self.cap + 1])
+        self._complete[kind] = len(ids) <= self.cap
+        self._ids[kind] = ids if self._complete[kind] else set()
+        self._checked[kind] = set()
+
+    def prime(self, kind, ids):
+        """Заранее проверяет пачку id, если набор загружен не целиком."""
+        if self.user.is_anonymous:
+            return
+        self._load(kind)
+        if self._complete[kind]:
+            return
+        ids = set(ids) - self._checked[kind]
+        if not ids:
+            return
+        field = SOURCES[kind][1]
+        self._ids[kind].update(
+            self._query(kind).filter(**{f'{field}__in': ids}))
+        self._checked[kind].update(ids)
+
+    def contains(self, kind, pk):
+        if self.user.is_anonymous:
+            return False
+        self.prime(kind, [pk])
+        return pk in self._ids[kind]
+
+    def is_favorited(self, recipe_id):
+        return self.contains(FAVORITES, recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return self.contains(SHOPPING_CART, recipe_id)
+
+    def is_subscribed(self, author_id):
+        return self.contains(SUBSCRIPTIONS, author_id)
+
+
+def get_flag(obj, name, kind, context):
+    """Флаг name объекта для пользователя запроса.
+
+    Берётся из аннотации запроса, если она есть, затем из ViewerState
+    контекста, иначе проверяется отдельным запросом. Общий для
+    сериализаторов DRF и быстрых сериализаторов.
+    """
+    if hasattr(obj, name):
+        return getattr(obj, name)
+    viewer = context.get('viewer')
+    if viewer is not None:
+        return viewer.contains(kind, obj.id)
+    user = context['request'].user
+    if user.is_anonymous:
+        return False
+    model, field = SOURCES[kind]
+    return model.objects.filter(user=user, **{field: obj.id}).exists()
+
+
+def prime_users(viewer, users):
+    """Готовит подписки для пользователей без аннотации is_subscribed."""
+    user_ids = [user.id for user in users
+                if not hasattr(user, 'is_subscribed')]
+    if user_ids:
+        viewer.prime(SUBSCRIPTIONS, user_ids)
+
+
+def prime_recipes(viewer, recipes):
+    """Готовит избранное, корзину и подписки на авторов для рецептов.
+
+    Если флаги посчитаны аннотациями запроса, состояние пользователя
+    не нужно и не загружается.
+    """
+    recipe_ids = [recipe.id for recipe in recipes
+                  if not hasattr(recipe, 'is_favorited')]
+    if recipe_ids:
+        viewer.prime(FAVORITES, recipe_ids)
+    recipe_ids = [recipe.id for recipe in recipes
+                  if not hasattr(recipe, 'is_in_shopping_cart')]
+    if recipe_ids:
+        viewer.prime(SHOPPING_CART, recipe_ids)
+    author_ids = [
+        recipe.author_id for recipe in recipes
+        if recipe.author_id is not None and not (
+            Recipe.author.is_cached(recipe)
+            and hasattr(recipe.author, 'is_subscribed'))
+    ]
+    if author_ids:
+        viewer.prime(SUBSCRIPTIONS, author_ids)
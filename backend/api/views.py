@@ -1,14 +1,21 @@
 from datetime import datetime
+from functools import partial
 
+from django.conf import settings
 from django.contrib.auth.hashers import make_password
-from django.db import IntegrityError
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import (BooleanField, Count, Exists, OuterRef, Prefetch,
+                              Value, prefetch_related_objects)
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+from recipes.feed import schedule_fan_out
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            ShoppingCartLine, Tag)
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
@@ -18,16 +25,24 @@ from rest_framework.status import (HTTP_200_OK, HTTP_400_BAD_REQUEST,
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from users.models import Subscribe, User
 
+from .cache import INGREDIENTS, RECIPES, TAGS, CachedResponseMixin
+from .conditional import ConditionalGetMixin
+from .fast_serializers import FastSerializerMixin
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPagination
+from .ingredient_index import ingredient_index
+from .pagination import CustomPagination, FeedPagination
 from .permissions import IsAuthorAdminOrReadOnly
 from .serializers import (CustomUserSerializer, IngredientSerializer,
-                          RecipeReadSerializer, RecipeShortSerializer,
-                          RecipeWriteSerializer, SubscribeSerializer,
-                          TagSerializer)
+                          RecipeIdsSerializer, RecipeReadSerializer,
+                          RecipeShortSerializer, RecipeWriteSerializer,
+                          SubscribeSerializer, TagSerializer)
+from .shopping_list import (FORMATS, ShoppingListNegotiation, get_etag,
+                            stream_shopping_list)
+from .viewer_state import SUBSCRIPTIONS, ViewerState
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(ConditionalGetMixin, FastSerializerMixin,
+                        UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     pagination_class = CustomPagination
@@ -49,13 +64,38 @@ class CustomUserViewSet(UserViewSet):
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def get_versions(self, users):
+        viewer = ViewerState.for_request(self.request)
+        viewer.prime(SUBSCRIPTIONS, [user.id for user in users])
+        return [
+            (user.id, user.email, user.username, user.first_name,
+             user.last_name, viewer.is_subscribed(user.id))
+            for user in users
+        ]
+
+    def get_subscriptions_queryset(self):
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            recipes_count=Count('recipes', distinct=True),
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by('id')
+
+    def prefetch_recipes_preview(self, authors):
+        recipes = Recipe.objects.filter(author__in=authors)
+        limit = self.request.query_params.get('recipes_limit')
+        if limit is not None and limit.isdigit():
+            recipes = recipes.limit_per_author(int(limit))
+        prefetch_related_objects(authors, Prefetch(
+            'recipes', queryset=recipes, to_attr='recipes_preview'
+        ))
+
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        user = request.user
-        queryset = User.objects.filter(following__user=user)
-        pages = self.paginate_queryset(queryset)
-        serializer = SubscribeSerializer(
-            pages, many=True, context={'request': request}
+        pages = self.paginate_queryset(self.get_subscriptions_queryset())
+        self.prefetch_recipes_preview(pages)
+        serializer = self.get_read_serializer_class(SubscribeSerializer)(
+            pages, many=True, context=self.get_serializer_context()
         )
         return self.get_paginated_response(serializer.data)
 
@@ -76,8 +116,10 @@ class CustomUserViewSet(UserViewSet):
                                     status=status.HTTP_400_BAD_REQUEST)
 
                 Subscribe.objects.create(user=user, author=author)
-                serializer = SubscribeSerializer(author,
-                                                 context={'request': request})
+                FeedEntry.objects.follow(user, author)
+                serializer = self.get_read_serializer_class(
+                    SubscribeSerializer
+                )(author, context=self.get_serializer_context())
                 return Response(serializer.data,
                                 status=status.HTTP_201_CREATED)
 
@@ -85,6 +127,7 @@ class CustomUserViewSet(UserViewSet):
                 subscribe = Subscribe.objects.filter(user=user, author=author)
                 if subscribe.exists():
                     subscribe.delete()
+                    FeedEntry.objects.unfollow(user, author)
                     return Response(status=status.HTTP_204_NO_CONTENT)
                 else:
                     data = {'errors': 'Вы не можете подписаться.'}
@@ -96,18 +139,20 @@ class CustomUserViewSet(UserViewSet):
             return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
 
     def get_serializer_context(self):
-        return {'request': self.request}
+        return {'request': self.request,
+                'viewer': ViewerState.for_request(self.request)}
 
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
     def me(self, request):
         user = request.user
         if user.is_authenticated:
-            serializer = CustomUserSerializer(
-                user,
-                context=self.get_serializer_context()
+            return self.conditional_response(
+                lambda: Response(CustomUserSerializer(
+                    user, context=self.get_serializer_context()
+                ).data, status=HTTP_200_OK),
+                [user],
             )
-            return Response(serializer.data, status=HTTP_200_OK)
         else:
             return Response({'detail': 'Учетные данные не предоставлены.'},
                             status=HTTP_401_UNAUTHORIZED)
@@ -117,35 +162,130 @@ class CustomUserViewSet(UserViewSet):
         return self.me(request)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(CachedResponseMixin, ReadOnlyModelViewSet):
+    cache_namespace = INGREDIENTS
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthorAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(self.search, request)
+
+    def search(self, request):
+        name = request.query_params.get('name', '')
+        limit = request.query_params.get('limit')
+        if limit is not None and limit.isdigit():
+            limit = int(limit)
+        else:
+            limit = settings.INGREDIENT_SEARCH_LIMIT if name else None
+        return Response(ingredient_index.search(name, limit))
+
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(CachedResponseMixin, ReadOnlyModelViewSet):
+    cache_namespace = TAGS
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthorAdminOrReadOnly,)
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(CachedResponseMixin, ConditionalGetMixin,
+                    FastSerializerMixin, ModelViewSet):
+    cache_namespace = RECIPES
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorAdminOrReadOnly,)
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def should_cache(self, request):
+        return request.user.is_anonymous
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_anonymous:
+            is_false = Value(False, output_field=BooleanField())
+            queryset = Recipe.objects.annotate(
+                is_favorited=is_false,
+                is_in_shopping_cart=is_false,
+                is_author_subscribed=is_false,
+            )
+        else:
+            queryset = Recipe.objects.annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+                # Нужно только для версии ответа, до загрузки авторов.
+                is_author_subscribed=Exists(Subscribe.objects.filter(
+                    user=user, author=OuterRef('author'))),
+            )
+        return queryset.prefetch_related(*self.get_prefetches())
+
+    def get_prefetches(self):
+        user = self.request.user
+        if user.is_anonymous:
+            authors = User.objects.annotate(
+                is_subscribed=Value(False, output_field=BooleanField()))
+        else:
+            authors = User.objects.annotate(is_subscribed=Exists(
+                Subscribe.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        return (
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch(
+                'ingredient_list',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient').order_by('ingredient__name')
+            ),
+        )
+
+    def get_versions(self, recipes):
+        return [
+            (recipe.id, recipe.updated_at, recipe.is_favorited,
+             recipe.is_in_shopping_cart, recipe.is_author_subscribed)
+            for recipe in recipes
+        ]
+
+    def get_last_modified(self, recipes):
+        # Подписки пользователя не отражаются в updated_at, а страница
+        # списка меняется и при удалении рецептов, поэтому Last-Modified
+        # точен только для рецепта, запрошенного анонимно.
+        if self.action != 'retrieve' or self.request.user.is_authenticated:
+            return None
+        return recipes[0].updated_at
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['viewer'] = ViewerState.for_request(self.request)
+        if self.action in ('list', 'feed'):
+            context['image_variant'] = 'medium'
+        return context
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        schedule_fan_out(serializer.save(author=self.request.user))
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
-            return RecipeReadSerializer
+            return self.get_read_serializer_class(RecipeReadSerializer)
         return RecipeWriteSerializer
 
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые первыми."""
+        paginator = FeedPagination()
+        ids = paginator.paginate_ids(
+            partial(FeedEntry.objects.page, request.user), request)
+        recipes = list(self.get_queryset().prefetch_related(None).filter(
+            id__in=ids))
+        return self.conditional_response(
+            lambda: paginator.get_paginated_response(
+                self.get_serializer(recipes, many=True).data),
+            recipes, paginator.get_paginated_response([]).data,
+        )
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -168,54 +308,137 @@ class RecipeViewSet(ModelViewSet):
         else:
             return self.delete_from(ShoppingCart, request.user, pk)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite/bulk',
+        permission_classes=[IsAuthenticated]
+    )
+    def favorite_bulk(self, request):
+        return self.bulk(Favorite, request)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart/bulk',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk(ShoppingCart, request)
+
+    @transaction.atomic
     def add_to(self, model, user, pk):
-        if model.objects.filter(user=user, recipe__id=pk).exists():
+        # Та же блокировка рецепта, что в bulk_add_to: из параллельных
+        # добавлений строку вставляет и меняет счётчик только одно.
+        recipe = get_object_or_404(Recipe.objects.select_for_update(),
+                                   id=pk)
+        if model.objects.filter(user=user, recipe=recipe).exists():
             return Response({'errors': 'Рецепт уже добавлен!'},
                             status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=pk)
         model.objects.create(user=user, recipe=recipe)
-        serializer = RecipeShortSerializer(recipe)
+        Recipe.objects.filter(id=recipe.id).change_counter(
+            model.counter_field, 1)
+        if model is ShoppingCart:
+            ShoppingCartLine.objects.add_recipe(user, recipe)
+        serializer = self.get_read_serializer_class(
+            RecipeShortSerializer)(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete_from(self, model, user, pk):
-        obj = model.objects.filter(user=user, recipe__id=pk)
-        if obj.exists():
-            obj.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response({'errors': 'Рецепт уже удален!'},
-                        status=status.HTTP_400_BAD_REQUEST)
+        deleted, _ = model.objects.filter(user=user, recipe__id=pk).delete()
+        if not deleted:
+            return Response({'errors': 'Рецепт уже удален!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        Recipe.objects.filter(id=pk).change_counter(model.counter_field,
+                                                    -deleted)
+        if model is ShoppingCart:
+            ShoppingCartLine.objects.remove_recipe(user, pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def bulk(self, model, request):
+        """Добавляет или удаляет список рецептов {"recipes": [id, ...]}
+        и возвращает статус для каждого id."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        if request.method == 'POST':
+            statuses = self.bulk_add_to(model, request.user, ids)
+        else:
+            statuses = self.bulk_delete_from(model, request.user, ids)
+        return Response({
+            'results': [{'id': pk, 'status': statuses[pk]} for pk in ids]
+        })
+
+    @transaction.atomic
+    def bulk_add_to(self, model, user, ids):
+        # Блокировка рецептов не даёт параллельным запросам добавить те же
+        # рецепты, пока счётчики и список покупок не обновлены. Рецепты
+        # блокируются по возрастанию id, чтобы запросы не ждали друг друга
+        # по кругу.
+        found = set(Recipe.objects.select_for_update().filter(
+            id__in=ids).order_by('id').values_list('id', flat=True))
+        existing = set(model.objects.filter(
+            user=user, recipe__in=found).values_list('recipe_id', flat=True))
+        added = found - existing
+        if added:
+            model.objects.bulk_create(
+                [model(user=user, recipe_id=pk) for pk in added],
+                ignore_conflicts=True,
+            )
+            Recipe.objects.filter(id__in=added).change_counter(
+                model.counter_field, 1)
+            if model is ShoppingCart:
+                ShoppingCartLine.objects.add_recipes(user, added)
+        return {
+            pk: 'added' if pk in added
+            else 'exists' if pk in found else 'not_found'
+            for pk in ids
+        }
+
+    @transaction.atomic
+    def bulk_delete_from(self, model, user, ids):
+        rows = model.objects.select_for_update().filter(
+            user=user, recipe__in=ids)
+        removed = set(rows.values_list('recipe_id', flat=True))
+        if removed:
+            rows.delete()
+            Recipe.objects.filter(id__in=removed).change_counter(
+                model.counter_field, -1)
+            if model is ShoppingCart:
+                ShoppingCartLine.objects.remove_recipes(user, removed)
+        return {pk: 'removed' if pk in removed else 'not_found' for pk in ids}
 
     @action(
         detail=False,
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        content_negotiation_class=ShoppingListNegotiation,
     )
     def download_shopping_cart(self, request):
         user = request.user
         if not user.shopping_cart.exists():
             return Response(status=HTTP_400_BAD_REQUEST)
 
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in FORMATS:
+            return Response(
+                {'errors': f'Доступные форматы: {", ".join(FORMATS)}.'},
+                status=HTTP_400_BAD_REQUEST
+            )
 
         today = datetime.today()
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n\n'
-            f'Дата: {today:%Y-%m-%d}\n\n'
+        etag = quote_etag(get_etag(user, file_format, today))
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        content_type = FORMATS[file_format][0]
+        response = StreamingHttpResponse(
+            stream_shopping_list(user, file_format, today),
+            content_type=f'{content_type}; charset=utf-8'
         )
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        shopping_list += f'\n\nFoodgram ({today:%Y})'
-
-        filename = f'{user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        filename = f'{user.username}_shopping_list.{file_format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
+        response['ETag'] = etag
 
         return response
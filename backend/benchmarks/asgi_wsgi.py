@@ -0,0 +1,163 @@
+"""Сравнение WSGI (gunicorn, sync-воркеры) и ASGI (gunicorn + uvicorn).
+
+Поднимает оба сервера на одной базе с одинаковым числом воркеров,
+нагружает эндпоинты чтения из concurrency потоков и печатает req/s,
+p50 и p99 задержки. Запуск из каталога backend:
+
+    python benchmarks/asgi_wsgi.py --concurrency 64 --duration 20
+
+Анонимные ответы кэшируются; чтобы измерить путь до БД, передайте
+токен пользователя через --token.
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?limit=20',
+    '/api/ingredients/?name=%D0%BA%D0%B0',
+    '/api/tags/',
+)
+
+SERVERS = {
+    'wsgi': (['foodgram.wsgi'], {'ASYNC_READ_VIEWS': 'False'}),
+    'asgi': (
+        ['--worker-class', 'uvicorn.workers.UvicornWorker', 'foodgram.asgi'],
+        {'ASYNC_READ_VIEWS': 'True'},
+    ),
+}
+
+
+def start_server(kind, port, workers):
+    args, env = SERVERS[kind]
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--log-level', 'warning', *args],
+        cwd=BACKEND_DIR, env={**os.environ, **env},
+    )
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        try:
+            connection.request('GET', PATHS[-1])
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+        finally:
+            connection.close()
+    raise RuntimeError(f'Сервер на порту {port} не запустился')
+
+
+def warm_up(port, paths, headers):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    for path in paths:
+        connection.request('GET', path, headers=headers)
+        connection.getresponse().read()
+    connection.close()
+
+
+def client(port, paths, offset, headers, deadline, latencies, errors):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    number = offset
+    while time.monotonic() < deadline:
+        path = paths[number % len(paths)]
+        number += 1
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors.append(path)
+            connection.close()
+            connection = http.client.HTTPConnection(
+                '127.0.0.1', port, timeout=60)
+            continue
+        latencies.append(time.perf_counter() - started)
+        if response.status != 200:
+            errors.append(path)
+    connection.close()
+
+
+def run_load(port, paths, headers, concurrency, duration):
+    latencies = []
+    errors = []
+    warm_up(port, paths, headers)
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=client, args=(
+            port, paths, number, headers, deadline, latencies, errors))
+        for number in range(concurrency)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(quantiles[49] * 1000, 1),
+        'p99_ms': round(quantiles[98] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', nargs='+', choices=SERVERS,
+                        default=list(SERVERS))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--token', help='Токен для авторизованных запросов')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='Эндпоинт для нагрузки; можно повторять')
+    parser.add_argument('--json', action='store_true',
+                        help='Вывести результаты в JSON')
+    options = parser.parse_args()
+    paths = list(options.paths or PATHS)
+    headers = {'Authorization': f'Token {options.token}'} if (
+        options.token) else {}
+
+    results = {}
+    for number, kind in enumerate(options.servers):
+        port = options.port + number
+        server = start_server(kind, port, options.workers)
+        try:
+            wait_ready(port)
+            results[kind] = run_load(port, paths, headers,
+                                     options.concurrency, options.duration)
+        finally:
+            server.terminate()
+            server.wait()
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f'{"":6}{"req/s":>10}{"p50, мс":>10}{"p99, мс":>10}'
+          f'{"запросов":>10}{"ошибок":>8}')
+    for kind, result in results.items():
+        print(f'{kind:6}{result["rps"]:>10}{result["p50_ms"]:>10}'
+              f'{result["p99_ms"]:>10}{result["requests"]:>10}'
+              f'{result["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
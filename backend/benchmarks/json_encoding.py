@@ -0,0 +1,112 @@
+"""Микробенчмарк кодирования JSON: страница из 50 рецептов.
+
+Берёт ответ GET /api/recipes/?limit=50 от имени пользователя с
+подписками (вложенные author, tags и ingredients) и замеряет только
+render() у JSONRenderer на стандартном json и у FastJSONRenderer.
+Запуск из каталога backend:
+
+    python -m benchmarks.json_encoding --rounds 2000
+
+Используется та же база, что у benchmarks.suite.
+"""
+import argparse
+import datetime
+import decimal
+import json
+import os
+import statistics
+import time
+
+import django
+
+PAGE_SIZE = 50
+
+
+def measure(render, data, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        render(data)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e6, min(timings) * 1e6
+
+
+def check_types(renderers):
+    """Нестандартные типы кодируются всеми рендерерами одинаково."""
+    from django.utils.translation import gettext_lazy
+
+    sample = {
+        'decimal': decimal.Decimal('1.50'),
+        'datetime': datetime.datetime(
+            2021, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'date': datetime.date(2021, 5, 1),
+        'time': datetime.time(12, 30),
+        'timedelta': datetime.timedelta(minutes=90),
+        'lazy': gettext_lazy('Рецепт'),
+        'text': 'строка\u2028с разделителем',
+    }
+    outputs = {name: render(sample) for name, render in renderers.items()}
+    reference = next(iter(outputs.values()))
+    for name, output in outputs.items():
+        if output != reference:
+            raise SystemExit(f'{name}: {output!r} != {reference!r}')
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+
+    from api.renderers import FastJSONRenderer, orjson
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+    from rest_framework.renderers import JSONRenderer
+    from users.models import Subscribe
+
+    from .seed import prepare_database
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=1000)
+    parser.add_argument('--reseed', action='store_true',
+                        help='Пересоздать базу')
+    options = parser.parse_args()
+
+    # Параметры генератора по умолчанию, как у benchmarks.suite.
+    prepare_database(options.reseed, users=200, recipes=2000, favorites=20,
+                     carts=5, subscriptions=10, seed=42)
+    user_id = Subscribe.objects.values_list('user', flat=True).first()
+    token = Token.objects.get_or_create(user_id=user_id)[0]
+    response = Client().get(
+        f'/api/recipes/?limit={PAGE_SIZE}',
+        HTTP_AUTHORIZATION=f'Token {token.key}',
+    )
+    data = response.data
+
+    renderers = {
+        'json': JSONRenderer().render,
+        'fast': FastJSONRenderer().render,
+    }
+    check_types(renderers)
+    if renderers['json'](data) != renderers['fast'](data):
+        raise SystemExit('Рендереры вернули разные ответы')
+
+    size = len(renderers['json'](data))
+    print(f'Страница: {len(data["results"])} рецептов, {size} байт; '
+          f'orjson {orjson.__version__ if orjson else "не установлен"}')
+    print(f'{"":8}{"медиана, мкс":>14}{"минимум, мкс":>14}')
+    results = {}
+    for name, render in renderers.items():
+        results[name] = measure(render, data, options.rounds)
+        print(f'{name:8}{results[name][0]:>14.1f}{results[name][1]:>14.1f}')
+    print(f'Ускорение по медиане: '
+          f'{results["json"][0] / results["fast"][0]:.1f}x')
+    # Разбор того же тела: FastJSONParser против json.loads.
+    body = renderers['json'](data)
+    if orjson:
+        loads = {'json': json.loads, 'fast': orjson.loads}
+        for name, parse in loads.items():
+            median, _ = measure(parse, body, options.rounds)
+            print(f'разбор {name}: {median:.1f} мкс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Прогон сценариев через тестовый клиент Django."""
+import json
+import random
+import statistics
+import sys
+import time
+
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from .scenarios import SCENARIOS, Dataset
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+class Runner:
+    def __init__(self):
+        self.client = Client()
+        self.tokens = {}
+
+    def headers(self, user_id):
+        if user_id is None:
+            return {}
+        if user_id not in self.tokens:
+            self.tokens[user_id] = Token.objects.get_or_create(
+                user_id=user_id)[0].key
+        return {'HTTP_AUTHORIZATION': f'Token {self.tokens[user_id]}'}
+
+    def call(self, method, path, data, user_id):
+        kwargs = self.headers(user_id)
+        if data is not None:
+            kwargs.update(data=json.dumps(data),
+                          content_type='application/json')
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(path, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, len(queries)
+
+    def run(self, specs, warmup):
+        for spec in specs[:warmup]:
+            self.call(*spec)
+        latencies = []
+        query_counts = []
+        errors = 0
+        started = time.perf_counter()
+        for spec in specs[warmup:]:
+            status, elapsed, query_count = self.call(*spec)
+            latencies.append(elapsed)
+            query_counts.append(query_count)
+            errors += status >= 400
+        total = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': round(len(latencies) / total, 1) if total else 0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'queries_mean': round(statistics.mean(query_counts), 1),
+            'queries_max': max(query_counts),
+        }
+
+
+def run_scenarios(names, requests, warmup, seed):
+    """Сценарии, меняющие данные, выполняются в откатываемой транзакции;
+    токены создаются заранее, чтобы не попасть в откат и в замеры."""
+    data = Dataset()
+    runner = Runner()
+    results = {}
+    for name in names:
+        scenario, mutates = SCENARIOS[name]
+        rng = random.Random(f'{seed}:{name}')
+        specs = [scenario(data, rng) for _ in range(warmup + requests)]
+        for spec in specs:
+            runner.headers(spec[3])
+        if not mutates:
+            results[name] = runner.run(specs, warmup)
+        else:
+            with transaction.atomic():
+                results[name] = runner.run(specs, warmup)
+                transaction.set_rollback(True)
+        print(f'{name}: {results[name]["rps"]} req/s', file=sys.stderr)
+    return results
@@ -0,0 +1,129 @@
+"""Сценарии нагрузки: каждый возвращает запрос (method, path, data, user_id).
+
+Сценарии с mutates=True выполняются в транзакции, которая затем
+откатывается, поэтому повторные прогоны идут по одним и тем же данным.
+"""
+from urllib.parse import urlencode
+
+from django.db.models import Count
+from recipes.models import Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Subscribe, User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAAD'
+    'UlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+PAGE_SIZE = 6
+LARGE_RECIPE = 30
+
+
+class Dataset:
+    """Идентификаторы из базы, из которых сценарии собирают запросы."""
+
+    def __init__(self):
+        self.users = list(User.objects.values_list('id', flat=True))
+        self.recipes = list(Recipe.objects.values_list('id', 'author_id'))
+        self.tags = list(Tag.objects.values_list('id', 'slug'))
+        self.ingredients = list(
+            Ingredient.objects.values_list('id', 'name'))
+        self.subscribers = list(
+            Subscribe.objects.values_list('user_id', flat=True).distinct())
+        self.cart_owners = list(
+            ShoppingCart.objects.values_list('user_id', flat=True).distinct())
+        self.authors = list(
+            User.objects.annotate(count=Count('recipes'))
+            .filter(count__gt=0).values_list('id', flat=True))
+
+    def recipe_payload(self, rng, size=None):
+        ingredients = rng.sample(self.ingredients, size or rng.randint(3, 10))
+        return {
+            'name': f'Бенчмарк: {ingredients[0][1]}',
+            'text': ', '.join(name for _, name in ingredients),
+            'cooking_time': rng.randint(5, 180),
+            'tags': [pk for pk, _ in rng.sample(
+                self.tags, rng.randint(1, len(self.tags)))],
+            'ingredients': [
+                {'id': pk, 'amount': rng.randint(1, 500)}
+                for pk, _ in ingredients
+            ],
+        }
+
+
+def recipes_list(data, rng):
+    pages = max(1, min(50, len(data.recipes) // PAGE_SIZE))
+    params = {'page': rng.randint(1, pages), 'limit': PAGE_SIZE}
+    variant = rng.random()
+    if variant < 0.3:
+        params['tags'] = rng.choice(data.tags)[1]
+    elif variant < 0.4:
+        params['author'] = rng.choice(data.authors)
+        params['page'] = 1
+    user = rng.choice(data.users) if rng.random() < 0.5 else None
+    return 'get', f'/api/recipes/?{urlencode(params)}', None, user
+
+
+def recipe_detail(data, rng):
+    pk, _ = rng.choice(data.recipes)
+    user = rng.choice(data.users) if rng.random() < 0.5 else None
+    return 'get', f'/api/recipes/{pk}/', None, user
+
+
+def subscriptions(data, rng):
+    params = urlencode({'page': 1, 'limit': PAGE_SIZE, 'recipes_limit': 3})
+    return ('get', f'/api/users/subscriptions/?{params}', None,
+            rng.choice(data.subscribers))
+
+
+def feed(data, rng):
+    return ('get', f'/api/recipes/feed/?limit={PAGE_SIZE}', None,
+            rng.choice(data.subscribers))
+
+
+def ingredient_search(data, rng):
+    _, name = rng.choice(data.ingredients)
+    query = urlencode({'name': name[:rng.randint(1, 4)]})
+    return 'get', f'/api/ingredients/?{query}', None, None
+
+
+def shopping_cart(data, rng):
+    fmt = rng.choice(('txt', 'csv', 'json'))
+    return ('get', f'/api/recipes/download_shopping_cart/?format={fmt}',
+            None, rng.choice(data.cart_owners))
+
+
+def recipe_create(data, rng):
+    payload = data.recipe_payload(rng)
+    payload['image'] = IMAGE
+    return 'post', '/api/recipes/', payload, rng.choice(data.users)
+
+
+def recipe_update(data, rng):
+    pk, author = rng.choice(data.recipes)
+    return 'patch', f'/api/recipes/{pk}/', data.recipe_payload(rng), author
+
+
+def recipe_create_large(data, rng):
+    payload = data.recipe_payload(rng, LARGE_RECIPE)
+    payload['image'] = IMAGE
+    return 'post', '/api/recipes/', payload, rng.choice(data.users)
+
+
+def recipe_update_large(data, rng):
+    pk, author = rng.choice(data.recipes)
+    return ('patch', f'/api/recipes/{pk}/',
+            data.recipe_payload(rng, LARGE_RECIPE), author)
+
+
+# Имя: (сценарий, меняет ли данные).
+SCENARIOS = {
+    'recipes_list': (recipes_list, False),
+    'recipe_detail': (recipe_detail, False),
+    'subscriptions': (subscriptions, False),
+    'feed': (feed, False),
+    'ingredient_search': (ingredient_search, False),
+    'shopping_cart': (shopping_cart, False),
+    'recipe_create': (recipe_create, True),
+    'recipe_update': (recipe_update, True),
+    'recipe_create_large': (recipe_create_large, True),
+    'recipe_update_large': (recipe_update_large, True),
+}
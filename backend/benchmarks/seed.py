@@ -0,0 +1,150 @@
+"""Генератор данных для бенчмарков.
+
+Активность авторов, популярность ингредиентов и рецептов распределены
+по закону Ципфа: немногие авторы пишут большую часть рецептов, а
+немногие рецепты собирают большую часть избранного и подписок.
+"""
+import heapq
+import json
+import os
+import random
+import sys
+import time
+from operator import itemgetter
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import transaction
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            ShoppingCartLine, Tag)
+from recipes.search import update_search_index
+from users.models import Subscribe, User
+
+PASSWORD = 'benchmark-password'
+IMAGE = 'recipes/benchmark.png'
+INDEX_BATCH = 500
+
+
+def zipf_weights(count, exponent=1.0):
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+def weighted_sample(rng, population, weights, k):
+    """k различных элементов с вероятностью, пропорциональной весу."""
+    keys = heapq.nlargest(
+        k,
+        ((rng.random() ** (1 / weight), item)
+         for item, weight in zip(population, weights)),
+        key=itemgetter(0),
+    )
+    return [item for _, item in keys]
+
+
+def load_reference_data():
+    call_command('import_data', 'ingredients', verbosity=0)
+    call_command('import_data', 'tags', verbosity=0)
+
+
+@transaction.atomic
+def seed(users=200, recipes=2000, favorites=20, carts=5, subscriptions=10,
+         seed=42):
+    """Заполняет пустую базу; средние числа на пользователя —
+    favorites, carts и subscriptions."""
+    rng = random.Random(seed)
+    load_reference_data()
+    ingredients = list(Ingredient.objects.values_list('id', flat=True))
+    ingredient_names = dict(Ingredient.objects.values_list('id', 'name'))
+    tags = list(Tag.objects.values_list('id', flat=True))
+    rng.shuffle(ingredients)
+    ingredient_weights = zipf_weights(len(ingredients))
+
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        User(email=f'user{number}@benchmark.ru', username=f'user{number}',
+             first_name='Имя', last_name='Фамилия', password=password)
+        for number in range(users)
+    )
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+    author_weights = zipf_weights(len(user_ids), 0.8)
+
+    recipe_objects = []
+    recipe_ingredients = []
+    for author_id in rng.choices(user_ids, author_weights, k=recipes):
+        count = round(rng.triangular(2, 15, 6))
+        chosen = weighted_sample(rng, ingredients, ingredient_weights, count)
+        names = [ingredient_names[pk] for pk in chosen]
+        recipe_objects.append(Recipe(
+            author_id=author_id,
+            name=f'{names[0].capitalize()} с {names[-1]}'[:200],
+            text='Смешать: ' + ', '.join(names) + '.',
+            image=IMAGE,
+            cooking_time=rng.randint(5, 180),
+        ))
+        recipe_ingredients.append(chosen)
+    Recipe.objects.bulk_create(recipe_objects)
+    recipe_ids = list(
+        Recipe.objects.order_by('id').values_list('id', flat=True))
+
+    IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                           amount=rng.choice((1, 2, 5, 10, 50, 100, 200)))
+        for recipe_id, chosen in zip(recipe_ids, recipe_ingredients)
+        for ingredient_id in chosen
+    )
+    recipe_tag = Recipe.tags.through
+    recipe_tag.objects.bulk_create(
+        recipe_tag(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rng.sample(tags, rng.randint(1, len(tags)))
+    )
+
+    popular = recipe_ids[:]
+    rng.shuffle(popular)
+    recipe_weights = zipf_weights(len(popular))
+    for model, mean in ((Favorite, favorites), (ShoppingCart, carts)):
+        model.objects.bulk_create(
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in weighted_sample(
+                rng, popular, recipe_weights, rng.randint(0, 2 * mean))
+        )
+    Subscribe.objects.bulk_create(
+        Subscribe(user_id=user_id, author_id=author_id)
+        for user_id in user_ids
+        for author_id in weighted_sample(
+            rng, user_ids, author_weights, rng.randint(0, 2 * subscriptions))
+        if author_id != user_id
+    )
+
+    for start in range(0, len(recipe_ids), INDEX_BATCH):
+        update_search_index(recipe_ids[start:start + INDEX_BATCH])
+    ShoppingCartLine.objects.rebuild()
+    Recipe.objects.recount()
+    FeedEntry.objects.rebuild()
+
+
+def prepare_database(reseed=False, **params):
+    """Создаёт и заполняет базу, если её нет или параметры изменились.
+
+    Параметры генератора хранятся рядом с базой в <база>.json.
+    """
+    path = settings.DATABASES['default']['NAME']
+    params_path = f'{path}.json'
+    if not reseed and os.path.exists(path):
+        try:
+            with open(params_path) as file:
+                if json.load(file) == params:
+                    return
+        except (OSError, ValueError):
+            pass
+    if os.path.exists(path):
+        os.remove(path)
+    started = time.monotonic()
+    call_command('migrate', verbosity=0)
+    seed(**params)
+    with open(params_path, 'w') as file:
+        json.dump(params, file)
+    print(f'База заполнена за {time.monotonic() - started:.1f} с',
+          file=sys.stderr)
@@ -0,0 +1,38 @@
+"""Настройки прогона бенчмарков: отдельная SQLite-база в этом каталоге."""
+import os
+
+from foodgram.settings import *  # noqa: F401,F403
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEBUG = False
+ALLOWED_HOSTS = ['testserver']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv(
+            'BENCHMARK_DB', os.path.join(BENCHMARK_DIR, 'db.sqlite3')
+        ),
+    }
+}
+
+MEDIA_ROOT = os.path.join(BENCHMARK_DIR, 'media')
+
+# По умолчанию кэш ответов выключен, чтобы измерять путь до БД.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'BENCHMARK_CACHE', 'django.core.cache.backends.dummy.DummyCache'
+        ),
+    }
+}
+
+# Обработка изображений не должна попадать в замеры создания рецепта.
+JOB_QUEUE = True
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# Строки метрик на каждый запрос только мешают выводу бенчмарка.
+LOGGING['loggers']['api.metrics'] = {'level': 'WARNING'}  # noqa: F405
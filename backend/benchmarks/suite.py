@@ -0,0 +1,117 @@
+"""Воспроизводимый бенчмарк API на локальной SQLite.
+
+Заполняет отдельную базу генератором из seed.py, прогоняет сценарии
+из scenarios.py через тестовый клиент Django (весь стек middleware и
+DRF, без сети) и печатает для каждого эндпоинта req/s, p50/p95/p99
+задержки и число SQL-запросов. Запуск из каталога backend:
+
+    python -m benchmarks.suite --output benchmarks/reports/new.json
+    python -m benchmarks.suite --baseline benchmarks/reports/new.json
+
+База пересоздаётся, если её нет или изменились параметры генератора.
+Отчёты в JSON можно сравнивать между собой: --baseline печатает
+изменение относительно прежнего отчёта.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import django
+
+SEED_OPTIONS = ('users', 'recipes', 'favorites', 'carts', 'subscriptions',
+                'seed')
+COMPARED = ('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_mean')
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, baseline=None):
+    print(f'{"":20}{"req/s":>9}{"p50":>9}{"p95":>9}{"p99":>9}'
+          f'{"запросы":>9}{"ошибки":>8}')
+    for name, result in results.items():
+        values = ''.join(f'{result[key]:>9}' for key in COMPARED)
+        print(f'{name:20}{values}{result["errors"]:>8}')
+        previous = (baseline or {}).get(name)
+        if previous:
+            deltas = ''.join(
+                f'{(result[key] - previous[key]) / previous[key]:>+9.0%}'
+                if previous[key] else f'{"—":>9}'
+                for key in COMPARED
+            )
+            print(f'{"  к baseline":20}{deltas}')
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+
+    from .runner import run_scenarios
+    from .scenarios import SCENARIOS
+    from .seed import prepare_database
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--recipes', type=int, default=2000)
+    parser.add_argument('--favorites', type=int, default=20,
+                        help='Среднее число избранных рецептов')
+    parser.add_argument('--carts', type=int, default=5,
+                        help='Среднее число рецептов в корзине')
+    parser.add_argument('--subscriptions', type=int, default=10,
+                        help='Среднее число подписок')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reseed', action='store_true',
+                        help='Пересоздать базу')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS,
+                        default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Запросов на сценарий')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--output', help='Сохранить отчёт в JSON')
+    parser.add_argument('--baseline', help='Сравнить с прежним отчётом')
+    options = parser.parse_args()
+
+    dataset = {name: getattr(options, name) for name in SEED_OPTIONS}
+    prepare_database(options.reseed, **dataset)
+    results = run_scenarios(options.scenarios, options.requests,
+                            options.warmup, options.seed)
+    report = {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(
+                timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': f'sqlite {connection.Database.sqlite_version}',
+            'cache': settings.CACHES['default']['BACKEND'],
+            'dataset': dataset,
+            'requests': options.requests,
+        },
+        'scenarios': results,
+    }
+    if options.output:
+        os.makedirs(os.path.dirname(options.output) or '.', exist_ok=True)
+        with open(options.output, 'w') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as file:
+            baseline = json.load(file)['scenarios']
+    print_table(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import os
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+
+from .pool import ConnectionPool, count, lock, pools
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL с проверкой постоянных соединений и пулом.
+
+    CONN_HEALTH_CHECKS — как в Django 4.1: постоянное соединение перед
+    первым запросом к БД в новом HTTP-запросе проверяется SELECT 1 и при
+    обрыве открывается заново.
+
+    OPTIONS['pool'] — параметры ConnectionPool, как в Django 5.1:
+    соединения берутся из пула процесса и возвращаются в него вместо
+    закрытия. С пулом CONN_MAX_AGE должен быть 0.
+
+    Время получения соединения попадает в метрики запроса как db_connect.
+    """
+    health_check_done = False
+    pool = None
+
+    def check_settings(self):
+        super().check_settings()
+        if self.pool_options and self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured(
+                'Пул соединений нельзя совмещать с CONN_MAX_AGE: '
+                'задайте CONN_MAX_AGE = 0.')
+
+    @property
+    def pool_options(self):
+        # Служебное соединение без БД (создание тестовой базы) живёт
+        # недолго, держать его в пуле незачем.
+        if self.alias == NO_DB_ALIAS:
+            return None
+        return self.settings_dict['OPTIONS'].get('pool')
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_pool(self, conn_params):
+        with lock:
+            pool = pools.get(self.alias)
+            # Соединения, открытые до fork, дочернему процессу не годятся.
+            if pool is None or pool.pid != os.getpid():
+                pool = None
+            elif pool.params != conn_params:
+                pool.close()
+                pool = None
+            if pool is None:
+                pool = pools[self.alias] = ConnectionPool(
+                    self.alias, base.Database.connect, conn_params,
+                    **self.pool_options,
+                )
+        return pool
+
+    def get_new_connection(self, conn_params):
+        # api.metrics загружает модели, а бэкенд БД импортируется во
+        # время их загрузки.
+        from api.metrics import timer
+
+        started = time.perf_counter()
+        with timer('db_connect'):
+            if not self.pool_options:
+                count(self.alias, opened=1)
+                connection = super().get_new_connection(conn_params)
+            else:
+                self.pool = self.get_pool(conn_params)
+                connection = self.pool.getconn()
+                options = self.settings_dict['OPTIONS']
+                self.isolation_level = options.get(
+                    'isolation_level', connection.isolation_level)
+                if self.isolation_level != connection.isolation_level:
+                    connection.set_session(
+                        isolation_level=self.isolation_level)
+                base.psycopg2.extras.register_default_jsonb(
+                    conn_or_curs=connection, loads=lambda x: x)
+        count(self.alias, acquired=1,
+              acquire_seconds=time.perf_counter() - started)
+        return connection
+
+    def connect(self):
+        # Новое соединение не проверяется: set_autocommit() внутри
+        # connect() тоже вызывает ensure_connection().
+        self.health_check_done = True
+        super().connect()
+
+    def _close(self):
+        if self.pool is None:
+            super()._close()
+            return
+        pool, self.pool = self.pool, None
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                pool.putconn(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')
+                and not self.in_atomic_block):
+            self.health_check_done = True
+            if not self.is_usable():
+                count(self.alias, health_check_failures=1)
+                self.close()
+        super().ensure_connection()
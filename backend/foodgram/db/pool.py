@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from psycopg2 import Error, OperationalError
+from psycopg2.extensions import (TRANSACTION_STATUS_IDLE,
+                                 TRANSACTION_STATUS_UNKNOWN)
+
+lock = threading.Lock()
+counters = defaultdict(Counter)
+pools = {}
+
+
+def count(alias, **values):
+    with lock:
+        counters[alias].update(values)
+
+
+def get_pool_stats():
+    """Счётчики соединений и состояние пулов по псевдонимам БД."""
+    with lock:
+        stats = {alias: dict(values) for alias, values in counters.items()}
+    for alias, pool in list(pools.items()):
+        stats.setdefault(alias, {}).update(pool.state())
+    return stats
+
+
+class ConnectionPool:
+    """Пул соединений psycopg2 внутри процесса.
+
+    Нужен, когда соединения берут разные потоки: пул потоков асинхронных
+    представлений, потоки воркера. Одновременно открыто не больше
+    max_size соединений; если все заняты, getconn ждёт до timeout
+    секунд. Простаивающие дольше max_idle секунд соединения сверх
+    min_size закрываются.
+    """
+
+    def __init__(self, alias, connect, params, min_size=1, max_size=10,
+                 timeout=10, max_idle=300, check=False):
+        self.alias = alias
+        self.pid = os.getpid()
+        self.connect = connect
+        self.params = params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check = check
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.idle = deque()
+        self.in_use = 0
+
+    def getconn(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            count(self.alias, timeouts=1)
+            raise OperationalError(
+                f'Нет свободного соединения с БД за {self.timeout} с '
+                f'(в пуле {self.max_size})')
+        try:
+            connection = self._take_idle() or self._open()
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.in_use += 1
+        return connection
+
+    def putconn(self, connection):
+        try:
+            if not connection.closed:
+                status = connection.info.transaction_status
+                if status == TRANSACTION_STATUS_UNKNOWN:
+                    connection.close()
+                elif status != TRANSACTION_STATUS_IDLE:
+                    self._rollback(connection)
+            if not connection.closed:
+                with self.lock:
+                    self.idle.append((connection, time.monotonic()))
+        finally:
+            with self.lock:
+                self.in_use -= 1
+            self.slots.release()
+        self._trim()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, deque()
+        for connection, _ in idle:
+            connection.close()
+
+    def state(self):
+        with self.lock:
+            return {'idle': len(self.idle), 'in_use': self.in_use,
+                    'max_size': self.max_size}
+
+    def _open(self):
+        count(self.alias, opened=1)
+        return self.connect(**self.params)
+
+    def _take_idle(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    return None
+                # Берётся последнее возвращённое соединение, чтобы давно
+                # простаивающие в начале очереди закрывал _trim.
+                connection, _ = self.idle.pop()
+            if connection.closed or self.check and not self._usable(
+                    connection):
+                count(self.alias, health_check_failures=1)
+                connection.close()
+                continue
+            return connection
+
+    def _usable(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+        except Error:
+            return False
+        return True
+
+    def _rollback(self, connection):
+        try:
+            connection.rollback()
+        except Error:
+            connection.close()
+
+    def _trim(self):
+        expired = []
+        deadline = time.monotonic() - self.max_idle
+        with self.lock:
+            while (len(self.idle) > self.min_size
+                   and self.idle[0][1] < deadline):
+                expired.append(self.idle.popleft()[0])
+        for connection in expired:
+            connection.close()
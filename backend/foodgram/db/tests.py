@@ -0,0 +1,160 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+from psycopg2 import OperationalError
+from psycopg2.extensions import (TRANSACTION_STATUS_IDLE,
+                                 TRANSACTION_STATUS_INTRANS,
+                                 TRANSACTION_STATUS_UNKNOWN)
+
+from .base import DatabaseWrapper
+from .pool import ConnectionPool, counters
+
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql):
+        if not self.connection.healthy:
+            raise OperationalError('server closed the connection')
+
+
+class FakeConnection:
+    """Соединение psycopg2 в объёме, который нужен пулу."""
+
+    def __init__(self):
+        self.closed = 0
+        self.healthy = True
+        self.rollbacks = 0
+        self.info = SimpleNamespace(transaction_status=TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def make_pool(self, **options):
+        alias = self.id()
+        counters.pop(alias, None)
+        self.addCleanup(counters.pop, alias, None)
+        self.opened = []
+
+        def connect():
+            connection = FakeConnection()
+            self.opened.append(connection)
+            return connection
+        return ConnectionPool(alias, connect, {}, **options)
+
+    def stats(self, pool):
+        return counters[pool.alias]
+
+    def test_connection_returns_to_pool(self):
+        pool = self.make_pool()
+        connection = pool.getconn()
+        self.assertEqual(pool.state()['in_use'], 1)
+        pool.putconn(connection)
+        self.assertEqual(pool.state(),
+                         {'idle': 1, 'in_use': 0, 'max_size': 10})
+        self.assertIs(pool.getconn(), connection)
+        self.assertEqual(self.stats(pool)['opened'], 1)
+
+    def test_open_transaction_is_rolled_back(self):
+        pool = self.make_pool()
+        connection = pool.getconn()
+        connection.info.transaction_status = TRANSACTION_STATUS_INTRANS
+        pool.putconn(connection)
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertIs(pool.getconn(), connection)
+
+    def test_broken_connection_is_not_kept(self):
+        pool = self.make_pool()
+        connection = pool.getconn()
+        connection.info.transaction_status = TRANSACTION_STATUS_UNKNOWN
+        pool.putconn(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.state()['idle'], 0)
+
+    def test_acquire_timeout(self):
+        pool = self.make_pool(max_size=1, timeout=0.01)
+        pool.getconn()
+        with self.assertRaises(OperationalError):
+            pool.getconn()
+        self.assertEqual(self.stats(pool)['timeouts'], 1)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_slot_is_released_after_failed_open(self):
+        pool = self.make_pool(max_size=1, timeout=0.01)
+        with mock.patch.object(pool, 'connect',
+                               side_effect=OperationalError('refused')):
+            with self.assertRaises(OperationalError):
+                pool.getconn()
+        pool.getconn()
+        self.assertEqual(self.stats(pool)['timeouts'], 0)
+
+    def test_idle_connections_are_trimmed(self):
+        pool = self.make_pool(min_size=1, max_idle=60)
+        clock = [1000.0]
+        with mock.patch('foodgram.db.pool.time.monotonic',
+                        lambda: clock[0]):
+            connections = [pool.getconn() for _ in range(3)]
+            for connection in connections:
+                pool.putconn(connection)
+            clock[0] += 120
+            pool.putconn(pool.getconn())
+        self.assertEqual(pool.state()['idle'], 1)
+        self.assertEqual([connection.closed for connection in connections],
+                         [1, 1, 0])
+
+    def test_failed_health_check_reopens(self):
+        pool = self.make_pool(check=True)
+        connection = pool.getconn()
+        pool.putconn(connection)
+        connection.healthy = False
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.stats(pool)['health_check_failures'], 1)
+        self.assertEqual(self.stats(pool)['opened'], 2)
+
+    def test_healthy_connection_is_reused(self):
+        pool = self.make_pool(check=True)
+        connection = pool.getconn()
+        pool.putconn(connection)
+        self.assertIs(pool.getconn(), connection)
+        self.assertEqual(connection.rollbacks, 1)
+
+
+class DatabaseWrapperPoolTest(SimpleTestCase):
+
+    def test_close_returns_connection_to_pool(self):
+        wrapper = DatabaseWrapper({
+            'NAME': 'foodgram', 'USER': '', 'PASSWORD': '', 'HOST': '',
+            'PORT': '', 'OPTIONS': {'pool': {}}, 'CONN_MAX_AGE': 0,
+            'TIME_ZONE': None, 'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False,
+        }, alias='pool-test')
+        wrapper.pool = pool = ConnectionPool(
+            'pool-test', FakeConnection, {})
+        self.addCleanup(counters.pop, 'pool-test', None)
+        wrapper.connection = connection = pool.getconn()
+        wrapper.close()
+        self.assertIsNone(wrapper.connection)
+        self.assertIsNone(wrapper.pool)
+        self.assertFalse(connection.closed)
+        self.assertEqual(pool.state()['idle'], 1)
+        self.assertIs(pool.getconn(), connection)
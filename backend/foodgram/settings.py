@@ -32,9 +32,11 @@ INSTALLED_APPS = [
     'api',
     'users',
     'recipes',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,14 +76,33 @@ if DEBUG:
         }
     }
 else:
+    DB_POOL = os.getenv('DB_POOL', False) == 'True'
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'foodgram.db',
             'NAME': os.getenv('POSTGRES_DB', 'django'),
             'USER': os.getenv('POSTGRES_USER', 'django'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
             'HOST': os.getenv('DB_HOST', ''),
-            'PORT': os.getenv('DB_PORT', 5432)
+            'PORT': os.getenv('DB_PORT', 5432),
+            # С пулом соединение возвращается в него в конце запроса.
+            'CONN_MAX_AGE': (
+                0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', 60))
+            ),
+            'CONN_HEALTH_CHECKS': (
+                os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+            ),
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+                    'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 300)),
+                    'check': (
+                        os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+                    ),
+                },
+            } if DB_POOL else {},
         }
     }
 
@@ -121,11 +142,37 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_VARIANT_FORMAT = os.getenv('IMAGE_VARIANT_FORMAT', 'WEBP')
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', 300)),
+    }
+}
+
+
+JOB_QUEUE = os.getenv('JOB_QUEUE', False) == 'True'
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', 10))
+JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', 600))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+JOB_CLAIM_BATCH = 10
+
+
+JOB_EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_BACKEND = (
+    'jobs.mail.QueuedEmailBackend' if JOB_QUEUE else JOB_EMAIL_BACKEND
+)
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 
@@ -134,7 +181,16 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
 
@@ -152,6 +208,29 @@ DJOSER = {
     'HIDE_USERS': False,
 }
 
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+VIEWER_STATE_CAP = int(os.getenv('VIEWER_STATE_CAP', 1000))
+BULK_RECIPES_LIMIT = int(os.getenv('BULK_RECIPES_LIMIT', 100))
+FAST_SERIALIZERS = os.getenv('FAST_SERIALIZERS', 'True') == 'True'
+
+FEED_SYNC_FOLLOWERS = int(os.getenv('FEED_SYNC_FOLLOWERS', 100))
+FEED_PULL_FOLLOWERS = int(os.getenv('FEED_PULL_FOLLOWERS', 10000))
+FEED_FANOUT_BATCH = int(os.getenv('FEED_FANOUT_BATCH', 1000))
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', 50))
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', 1))
+
+# Кэш токенов работает только с общим кэшем (CACHE_BACKEND не
+# LocMemCache): иначе сброс токена не дошёл бы до других процессов.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_LOCAL_TTL = int(os.getenv('AUTH_TOKEN_LOCAL_TTL', 30))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', False) == 'True'
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', 8))
+
+SQL_DUPLICATE_THRESHOLD = int(os.getenv('SQL_DUPLICATE_THRESHOLD', 5))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
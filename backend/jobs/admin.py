@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Модель Job в админке."""
+    list_display = ('id', 'task', 'status', 'attempts', 'run_at',
+                    'created_at')
+    search_fields = ('task',)
+    list_filter = ('status', 'task')
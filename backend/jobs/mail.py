@@ -0,0 +1,78 @@
+import base64
+from email.mime.base import MIMEBase
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from .models import Job
+
+
+def serialize_message(message):
+    """Письмо в виде, пригодном для JSON-полезной нагрузки задачи.
+
+    Возвращает None, если письмо нельзя передать через очередь без
+    потерь: вложение задано готовым MIMEBase или альтернатива не текст.
+    """
+    attachments = []
+    for attachment in message.attachments:
+        if isinstance(attachment, MIMEBase):
+            return None
+        filename, content, mimetype = attachment
+        if isinstance(content, bytes):
+            content = {'base64': base64.b64encode(content).decode('ascii')}
+        attachments.append([filename, content, mimetype])
+    alternatives = getattr(message, 'alternatives', [])
+    if any(not isinstance(content, str) for content, _ in alternatives):
+        return None
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'content_subtype': message.content_subtype,
+        'alternatives': [list(alternative) for alternative in alternatives],
+        'attachments': attachments,
+    }
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Ставит письма в очередь задач вместо отправки в запросе.
+
+    Отправляет их потом воркер через JOB_EMAIL_BACKEND. Письма, которые
+    не сериализуются без потерь, отправляются сразу через тот же бэкенд.
+    """
+
+    def send_messages(self, email_messages):
+        direct = []
+        for message in email_messages:
+            payload = serialize_message(message)
+            if payload is None:
+                direct.append(message)
+            else:
+                Job.objects.enqueue('jobs.mail.send_email', payload)
+        if direct:
+            get_connection(settings.JOB_EMAIL_BACKEND,
+                           fail_silently=self.fail_silently,
+                           ).send_messages(direct)
+        return len(email_messages)
+
+
+def send_email(message):
+    alternatives = message.pop('alternatives')
+    attachments = message.pop('attachments', [])
+    content_subtype = message.pop('content_subtype', 'plain')
+    email = EmailMultiAlternatives(
+        connection=get_connection(settings.JOB_EMAIL_BACKEND), **message)
+    email.content_subtype = content_subtype
+    for content, mimetype in alternatives:
+        email.attach_alternative(content, mimetype)
+    for filename, content, mimetype in attachments:
+        if isinstance(content, dict):
+            content = base64.b64decode(content['base64'])
+        email.attach(filename, content, mimetype)
+    email.send()
@@ -0,0 +1,75 @@
+import logging
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def work(stop, poll_interval, once):
+    """Цикл воркера: берёт задачи, пока не будет установлен stop."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    processed = 0
+    try:
+        while not stop.is_set():
+            job = Job.objects.claim()
+            if job is None:
+                if once:
+                    break
+                stop.wait(poll_interval)
+                continue
+            status = job.run()
+            processed += 1
+            logger.info('Задача %s %s: %s', job.pk, job.task, status)
+    finally:
+        connections.close_all()
+    return processed
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркеры очереди фоновых задач.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=settings.JOB_POLL_INTERVAL,
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и завершиться.',
+        )
+
+    def handle(self, *args, **options):
+        stop = multiprocessing.Event()
+        worker_args = (stop, options['poll_interval'], options['once'])
+        if options['concurrency'] <= 1:
+            signal.signal(signal.SIGTERM, lambda *args: stop.set())
+            try:
+                work(*worker_args)
+            except KeyboardInterrupt:
+                stop.set()
+            return
+        # Дочерние процессы не должны наследовать открытые соединения.
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=work, args=worker_args)
+            for _ in range(options['concurrency'])
+        ]
+        for worker in workers:
+            worker.start()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        logger.info('Запущено воркеров: %s', len(workers))
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            stop.set()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,123 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+MAX_LENGTH_TASK = 200
+
+
+class JobQuerySet(models.QuerySet):
+    def enqueue(self, task, *args, max_attempts=None, **kwargs):
+        """Ставит задачу в очередь; task — путь к функции."""
+        return self.create(
+            task=task,
+            payload={'args': list(args), 'kwargs': kwargs},
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        )
+
+    def claimable(self):
+        now = timezone.now()
+        expired = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+        return self.filter(
+            Q(status=Job.PENDING, run_at__lte=now)
+            | Q(status=Job.RUNNING, locked_at__lt=expired)
+        ).order_by('run_at', 'id')
+
+    def claim(self):
+        """Захватывает одну готовую к запуску задачу или возвращает None.
+
+        На PostgreSQL строка блокируется через SELECT ... FOR UPDATE
+        SKIP LOCKED, и воркеры не ждут друг друга. Там, где SKIP LOCKED
+        нет (SQLite), задача захватывается условным UPDATE: его выполнит
+        только один воркер, остальные возьмут следующую.
+        """
+        features = connections[self.db].features
+        if features.has_select_for_update_skip_locked:
+            with transaction.atomic(using=self.db):
+                job = self.claimable().select_for_update(
+                    skip_locked=True).first()
+                if job is None:
+                    return None
+                self.filter(pk=job.pk).update(
+                    status=Job.RUNNING, locked_at=timezone.now(),
+                    attempts=F('attempts') + 1)
+        else:
+            for job in self.claimable()[:settings.JOB_CLAIM_BATCH]:
+                claimed = self.filter(
+                    pk=job.pk, status=job.status, locked_at=job.locked_at
+                ).update(status=Job.RUNNING, locked_at=timezone.now(),
+                         attempts=F('attempts') + 1)
+                if claimed:
+                    break
+            else:
+                return None
+        job.refresh_from_db()
+        return job
+
+
+class Job(models.Model):
+    """Фоновая задача в очереди на базе данных."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    task = models.CharField('Задача', max_length=MAX_LENGTH_TASK)
+    payload = models.JSONField('Аргументы', default=dict)
+    status = models.CharField(
+        'Статус',
+        max_length=max(len(status) for status, _ in STATUSES),
+        choices=STATUSES,
+        default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField('Попытки', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Максимум попыток')
+    run_at = models.DateTimeField('Запустить после', default=timezone.now)
+    locked_at = models.DateTimeField('Захвачена', null=True, blank=True)
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} ({self.get_status_display()})'
+
+    def run(self):
+        """Выполняет задачу; при ошибке откладывает повтор с
+        экспоненциальной задержкой или помечает задачу проваленной."""
+        try:
+            import_string(self.task)(*self.payload.get('args', ()),
+                                     **self.payload.get('kwargs', {}))
+        except Exception as error:
+            self.last_error = f'{type(error).__name__}: {error}'
+            if self.attempts < self.max_attempts:
+                self.status = self.PENDING
+                self.run_at = timezone.now() + timedelta(
+                    seconds=settings.JOB_RETRY_DELAY
+                    * 2 ** (self.attempts - 1))
+            else:
+                self.status = self.FAILED
+        else:
+            self.status = self.DONE
+        self.locked_at = None
+        self.save(update_fields=['status', 'run_at', 'locked_at',
+                                 'last_error'])
+        return self.status
@@ -0,0 +1,55 @@
+from email.mime.text import MIMEText
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.test import TestCase, override_settings
+
+from .models import Job
+
+LOCMEM = 'django.core.mail.backends.locmem.EmailBackend'
+
+
+@override_settings(JOB_EMAIL_BACKEND=LOCMEM)
+class QueuedEmailBackendTest(TestCase):
+
+    def send(self, message):
+        message.connection = mail.get_connection(
+            'jobs.mail.QueuedEmailBackend')
+        message.send()
+
+    def test_attachments_and_alternatives_survive_queue(self):
+        message = EmailMultiAlternatives(
+            'Список покупок', 'Текст', 'foodgram@example.com',
+            ['user@example.com'])
+        message.attach_alternative('<p>Текст</p>', 'text/html')
+        message.attach('list.txt', 'Сахар — 5 г', 'text/plain')
+        message.attach('list.pdf', b'%PDF-\x00\xff', 'application/pdf')
+        self.send(message)
+        self.assertEqual(mail.outbox, [])
+
+        job = Job.objects.get()
+        job.refresh_from_db()
+        self.assertEqual(job.run(), Job.DONE)
+        sent, = mail.outbox
+        self.assertEqual(sent.alternatives, [('<p>Текст</p>', 'text/html')])
+        self.assertEqual(sent.attachments, [
+            ('list.txt', 'Сахар — 5 г', 'text/plain'),
+            ('list.pdf', b'%PDF-\x00\xff', 'application/pdf'),
+        ])
+
+    def test_html_body_keeps_subtype(self):
+        message = EmailMultiAlternatives(
+            'Тема', '<p>Текст</p>', to=['user@example.com'])
+        message.content_subtype = 'html'
+        self.send(message)
+        Job.objects.get().run()
+        self.assertEqual(mail.outbox[0].content_subtype, 'html')
+
+    def test_mime_attachment_is_sent_synchronously(self):
+        message = EmailMultiAlternatives(
+            'Тема', 'Текст', to=['user@example.com'])
+        message.attach(MIMEText('готовая часть'))
+        self.send(message)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(len(mail.outbox[0].attachments), 1)
@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                     ShoppingCart, Tag)
+from .images import schedule_image_variants
+from .models import (Favorite, FeedEntry, Ingredient, IngredientInRecipe,
+                     Recipe, ShoppingCart, ShoppingCartLine, Tag)
+from .search import update_search_index
 
 MININUN_NUM = 1
 
@@ -31,6 +33,11 @@ class IngredientAdmin(admin.ModelAdmin):
     list_filter = ('name',)
     inlines = (IngredientRecipeInline,)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if any(formset.has_changed() for formset in formsets):
+            ShoppingCartLine.objects.rebuild(ingredients=[form.instance.pk])
+
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
@@ -40,7 +47,18 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientRecipeInline,)
 
     def is_favorited(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_index([form.instance.pk])
+        if 'image' in form.changed_data:
+            schedule_image_variants(form.instance)
+        if any(formset.has_changed() for formset in formsets):
+            users = list(form.instance.shopping_cart.values_list(
+                'user', flat=True))
+            if users:
+                ShoppingCartLine.objects.rebuild(users)
 
 
 @admin.register(Favorite)
@@ -57,3 +75,34 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
     search_fields = ('user',)
     list_filter = ('user',)
+
+    # Список покупок пересчитывается целиком для затронутых
+    # пользователей: прежний рецепт правленой строки уже неизвестен.
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        users = {obj.user_id, form.initial.get('user')} - {None}
+        ShoppingCartLine.objects.rebuild(users)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingCartLine.objects.rebuild([obj.user_id])
+
+    def delete_queryset(self, request, queryset):
+        users = set(queryset.values_list('user', flat=True))
+        super().delete_queryset(request, queryset)
+        ShoppingCartLine.objects.rebuild(users)
+
+
+@admin.register(ShoppingCartLine)
+class ShoppingCartLineAdmin(admin.ModelAdmin):
+    """Модель ShoppingCartLine в админке."""
+    list_display = ('id', 'user', 'ingredient', 'total_amount')
+    search_fields = ('user',)
+    list_filter = ('user',)
+
+
+@admin.register(FeedEntry)
+class FeedEntryAdmin(admin.ModelAdmin):
+    """Модель FeedEntry в админке."""
+    list_display = ('id', 'user', 'recipe')
+    list_filter = ('user',)
@@ -0,0 +1,81 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from jobs.models import Job
+from users.models import Subscribe
+
+logger = logging.getLogger(__name__)
+
+executor = (
+    ThreadPoolExecutor(max_workers=settings.FEED_WORKERS,
+                       thread_name_prefix='recipe-feed')
+    if settings.FEED_WORKERS else None
+)
+
+
+def fan_out(recipe_id):
+    """Добавляет рецепт в ленты подписчиков автора пачками по
+    FEED_FANOUT_BATCH и отмечает его разосланным."""
+    from .models import FeedEntry, Recipe
+
+    author_id = Recipe.objects.filter(pk=recipe_id).values_list(
+        'author', flat=True).first()
+    if author_id is None:
+        return
+    followers = Subscribe.objects.filter(author=author_id).order_by(
+        'user').values_list('user', flat=True)
+    last_user = 0
+    while True:
+        batch = list(followers.filter(
+            user__gt=last_user)[:settings.FEED_FANOUT_BATCH])
+        if not batch:
+            break
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user_id=user, recipe_id=recipe_id) for user in batch],
+            ignore_conflicts=True,
+        )
+        last_user = batch[-1]
+    Recipe.objects.filter(pk=recipe_id).update(fanned_out=True)
+
+
+def run_fan_out(recipe_id):
+    try:
+        fan_out(recipe_id)
+    except Exception:
+        logger.exception('Не удалось разослать рецепт %s по лентам',
+                         recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_fan_out(recipe):
+    """Рассылает новый рецепт по лентам подписчиков автора.
+
+    Рецепты авторов, у которых FEED_PULL_FOLLOWERS подписчиков и
+    больше, не рассылаются: лента читает их у автора. До
+    FEED_SYNC_FOLLOWERS подписчиков рецепт рассылается сразу, иначе —
+    через очередь задач (JOB_QUEUE) или после коммита в пуле потоков.
+    Пока рассылка не закончена, лента тоже читает рецепт у автора.
+    """
+    if recipe.author_id is None:
+        return
+    followers = Subscribe.objects.filter(
+        author=recipe.author_id
+    )[:settings.FEED_PULL_FOLLOWERS].count()
+    if followers >= settings.FEED_PULL_FOLLOWERS:
+        return
+    if followers <= settings.FEED_SYNC_FOLLOWERS:
+        fan_out(recipe.pk)
+        return
+    if settings.JOB_QUEUE:
+        Job.objects.enqueue('recipes.feed.fan_out', recipe.pk)
+        return
+
+    def submit():
+        if executor is None:
+            fan_out(recipe.pk)
+        else:
+            executor.submit(run_fan_out, recipe.pk)
+    transaction.on_commit(submit)
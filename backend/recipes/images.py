@@ -0,0 +1,113 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from jobs.models import Job
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Наибольшие ширина и высота каждого варианта изображения рецепта.
+VARIANTS = {
+    'thumb': (320, 320),
+    'medium': (800, 800),
+    'full': (1600, 1600),
+}
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+executor = (
+    ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                       thread_name_prefix='recipe-images')
+    if settings.IMAGE_WORKERS else None
+)
+
+
+def render_variant(source, size, image_format):
+    """Уменьшенная копия без метаданных: EXIF и прочее не сохраняются."""
+    image = source.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, format=image_format,
+               quality=settings.IMAGE_VARIANT_QUALITY)
+    return image.size, buffer.getvalue()
+
+
+def build_image_variants(recipe_id):
+    """Создаёт варианты изображения рецепта и сохраняет их описание."""
+    from .models import Recipe
+
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    image_format = settings.IMAGE_VARIANT_FORMAT
+    stem = os.path.splitext(os.path.basename(recipe.image.name))[0]
+    with recipe.image.open('rb') as file:
+        source = ImageOps.exif_transpose(Image.open(file))
+        source.load()
+    variants = {}
+    for name, size in VARIANTS.items():
+        (width, height), content = render_variant(source, size, image_format)
+        path = (f'recipes/variants/{recipe.pk}/'
+                f'{stem}_{name}.{EXTENSIONS[image_format]}')
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        variants[name] = {
+            'path': default_storage.save(path, ContentFile(content)),
+            'width': width,
+            'height': height,
+        }
+    stale = {
+        variant['path'] for variant in recipe.image_variants.values()
+    } - {variant['path'] for variant in variants.values()}
+    recipe.image_variants = variants
+    recipe.save(update_fields=['image_variants', 'updated_at'])
+    for path in stale:
+        default_storage.delete(path)
+
+
+def run_build_image_variants(recipe_id):
+    try:
+        build_image_variants(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_variants(recipe):
+    """Отдаёт обработку изображения в очередь задач (JOB_QUEUE),
+    иначе после коммита — в пул потоков; при IMAGE_WORKERS = 0
+    обрабатывает сразу."""
+    if settings.JOB_QUEUE:
+        Job.objects.enqueue('recipes.images.build_image_variants', recipe.pk)
+        return
+
+    def submit():
+        if executor is None:
+            build_image_variants(recipe.pk)
+        else:
+            executor.submit(run_build_image_variants, recipe.pk)
+    transaction.on_commit(submit)
+
+
+def get_variant_urls(recipe, request=None):
+    """Адреса и размеры готовых вариантов изображения."""
+    result = {}
+    for name, variant in recipe.image_variants.items():
+        url = default_storage.url(variant['path'])
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        result[name] = {
+            'url': url,
+            'width': variant['width'],
+            'height': variant['height'],
+        }
+    return result
@@ -0,0 +1,28 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from recipes.images import build_image_variants
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии и для рецептов, где они уже есть.',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        processed = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            build_image_variants(recipe_id)
+            processed += 1
+        logger.info('Обработано изображений: %s', processed)
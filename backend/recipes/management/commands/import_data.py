@@ -0,0 +1,173 @@
+import csv
+import json
+import logging
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+from api.cache import bump_version
+from api.signals import CACHE_NAMESPACES
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from recipes.models import Ingredient, Recipe, Tag
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+MODELS = {
+    'ingredients': {
+        'model': Ingredient,
+        'fields': ('name', 'measurement_unit'),
+        'key': ('name', 'measurement_unit'),
+    },
+    'tags': {
+        'model': Tag,
+        'fields': ('name', 'color', 'slug'),
+        'key': ('slug',),
+    },
+}
+
+
+def iter_json_array(file):
+    """Потоково читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), ''):
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not buffer:
+                break
+            if not started:
+                if buffer[0] != '[':
+                    raise CommandError('Ожидался JSON-массив объектов.')
+                buffer = buffer[1:]
+                started = True
+            elif buffer[0] == ',':
+                buffer = buffer[1:]
+            elif buffer[0] == ']':
+                return
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    break
+                yield item
+                buffer = buffer[end:]
+    raise CommandError('JSON-массив не закрыт.')
+
+
+def iter_csv(file, fields):
+    for row in csv.reader(file, delimiter=','):
+        yield dict(zip(fields, row))
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты или теги из CSV/JSON. Повторный запуск '
+            'не создаёт дубликатов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=MODELS)
+        parser.add_argument(
+            'paths', nargs='*',
+            help='Файлы для загрузки, "-" — стандартный ввод. '
+                 'По умолчанию data/<model>.csv.',
+        )
+        parser.add_argument(
+            '--format', choices=('csv', 'json'),
+            help='Формат данных; по умолчанию определяется по расширению.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        config = MODELS[options['model']]
+        paths = options['paths'] or [
+            Path(settings.BASE_DIR) / 'data' / f'{options["model"]}.csv'
+        ]
+        model = config['model']
+        started = time.monotonic()
+        rows = 0
+        count_before = model.objects.count()
+        try:
+            with transaction.atomic():
+                for path in paths:
+                    for batch in self.read_batches(
+                            path, config, options['format'],
+                            options['batch_size']):
+                        self.save_batch(config, batch)
+                        rows += len(batch)
+        except IntegrityError as error:
+            raise CommandError(f'Ошибка загрузки: {error}')
+        # bulk_create и bulk_update не отправляют post_save, поэтому
+        # кэши ответов API (и с ними индекс ингредиентов) сбрасываются
+        # здесь.
+        bump_version(*CACHE_NAMESPACES[model])
+        elapsed = time.monotonic() - started
+        logger.info(
+            'Загрузка завершена: %s строк, новых записей %s, '
+            '%.1f с, %.0f строк/с',
+            rows, model.objects.count() - count_before, elapsed,
+            rows / elapsed if elapsed else rows,
+        )
+
+    def read_batches(self, path, config, file_format, batch_size):
+        path = str(path)
+        file_format = file_format or (
+            'json' if path.endswith('.json') else 'csv')
+        if path == '-':
+            file = sys.stdin
+        else:
+            try:
+                file = open(path, 'r', encoding='utf-8')
+            except OSError as error:
+                raise CommandError(f'Не удалось открыть {path}: {error}')
+        with file:
+            items = (
+                iter_json_array(file) if file_format == 'json'
+                else iter_csv(file, config['fields'])
+            )
+            items = (
+                {field: str(item.get(field, '')).strip()
+                 for field in config['fields']}
+                for item in items
+            )
+            items = (item for item in items if item['name'])
+            while True:
+                batch = list(islice(items, batch_size))
+                if not batch:
+                    return
+                yield batch
+
+    def save_batch(self, config, batch):
+        model = config['model']
+        key = config['key']
+        update_fields = [
+            field for field in config['fields'] if field not in key
+        ]
+        objects = {
+            tuple(item[field] for field in key): model(**item)
+            for item in batch
+        }
+        if not update_fields:
+            model.objects.bulk_create(objects.values(),
+                                      ignore_conflicts=True)
+            return
+        lookup = {f'{key[0]}__in': [values[0] for values in objects]}
+        existing = {
+            tuple(getattr(obj, field) for field in key): obj
+            for obj in model.objects.filter(**lookup)
+        }
+        for values, obj in existing.items():
+            new = objects.pop(values, None)
+            if new is not None:
+                for field in update_fields:
+                    setattr(obj, field, getattr(new, field))
+        model.objects.bulk_update(existing.values(), update_fields)
+        model.objects.bulk_create(objects.values())
+        if model is Tag and existing:
+            Recipe.objects.filter(
+                tags__in=list(existing.values())).touch()
@@ -0,0 +1,138 @@
+import json
+import logging
+import re
+
+from api.filters import IngredientFilter, RecipeFilter
+from api.shopping_list import get_ingredients
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingCartLine, Tag)
+from users.models import Subscribe, User
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 6
+INDEX_NODES = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+SQLITE_PLAN = re.compile(
+    r'\b(SCAN|SEARCH)(?: TABLE)? (\w+)(?: AS \w+)?'
+    r'(?: USING (?:COVERING )?INDEX (\w+)| USING (INTEGER PRIMARY KEY))?'
+)
+
+
+class Samples:
+    """Значения из базы, на которых строятся проверяемые запросы."""
+
+    def __init__(self):
+        subscription = Subscribe.objects.first()
+        self.user, self.author = (
+            (subscription.user_id, subscription.author_id)
+            if subscription else (0, 0)
+        )
+        self.recipe = Recipe.objects.values_list('id', flat=True).first() or 0
+        self.tag = Tag.objects.values_list('slug', flat=True).first() or ''
+        name = Ingredient.objects.values_list('name', flat=True).first()
+        self.prefix = (name or 'а')[:2]
+        self.cart_user = ShoppingCart.objects.values_list(
+            'user', flat=True).first() or 0
+
+
+def hot_queries(samples):
+    """Имя запроса и сам запрос в том виде, в каком его строит API."""
+    return (
+        ('ingredients_prefix', IngredientFilter(
+            {'name': samples.prefix}, queryset=Ingredient.objects.all()).qs),
+        ('ingredients_contains',
+         Ingredient.objects.filter(name__icontains=samples.prefix)),
+        ('recipes_by_tag', RecipeFilter(
+            {'tags': [samples.tag]}, queryset=Recipe.objects.all()
+        ).qs[:PAGE_SIZE]),
+        ('recipes_by_author', RecipeFilter(
+            {'author': samples.author}, queryset=Recipe.objects.all()
+        ).qs[:PAGE_SIZE]),
+        ('recipes_popular', Recipe.objects.order_by(
+            '-favorites_count', '-id')[:PAGE_SIZE]),
+        ('recipe_ingredients', IngredientInRecipe.objects.filter(
+            recipe=samples.recipe).select_related('ingredient')),
+        ('is_subscribed', Subscribe.objects.filter(
+            user=samples.user, author=samples.author)),
+        ('subscriptions', User.objects.filter(
+            following__user=samples.user)[:PAGE_SIZE]),
+        ('is_favorited', Favorite.objects.filter(
+            user=samples.user, recipe=samples.recipe)),
+        ('cart_totals', ShoppingCartLine.objects.expected_totals(
+            [samples.cart_user])),
+        ('shopping_list', get_ingredients(samples.cart_user)),
+    )
+
+
+def postgresql_scans(queryset):
+    """Таблицы, прочитанные целиком, и использованные индексы."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    seq_scans, indexes = set(), set()
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            seq_scans.add(node['Relation Name'])
+        elif node['Node Type'] in INDEX_NODES:
+            indexes.add(node['Index Name'])
+        nodes += node.get('Plans', [])
+    return seq_scans, indexes
+
+
+def sqlite_scans(queryset):
+    seq_scans, indexes = set(), set()
+    for action, table, index, rowid in SQLITE_PLAN.findall(
+            queryset.explain()):
+        if rowid:
+            indexes.add(f'{table} (rowid)')
+        elif index:
+            # SCAN по индексу — обход индекса целиком, например для
+            # сортировки с LIMIT.
+            indexes.add(index if action == 'SEARCH' else f'{index} (обход)')
+        elif action == 'SCAN':
+            seq_scans.add(table)
+    return seq_scans, indexes
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN для частых запросов API и сообщает, '
+            'какие индексы они используют и где читают таблицу целиком.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--plan',
+            action='store_true',
+            help='Вывести план каждого запроса целиком.',
+        )
+        parser.add_argument(
+            '--disable-seqscan',
+            action='store_true',
+            help=('PostgreSQL: запретить полный просмотр таблиц, чтобы '
+                  'проверить применимость индексов на маленькой базе.'),
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        postgresql = connection.vendor == 'postgresql'
+        if postgresql and options['disable_seqscan']:
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        scans = postgresql_scans if postgresql else sqlite_scans
+        problems = 0
+        for name, queryset in hot_queries(Samples()):
+            seq_scans, indexes = scans(queryset)
+            problems += bool(seq_scans)
+            log = logger.warning if seq_scans else logger.info
+            log('%s: индексы %s; полный просмотр %s', name,
+                ', '.join(sorted(indexes)) or '—',
+                ', '.join(sorted(seq_scans)) or '—')
+            if options['plan']:
+                self.stdout.write(queryset.explain())
+        logger.info('Запросов с полным просмотром таблиц: %s', problems)
@@ -0,0 +1,14 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from recipes.models import FeedEntry
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Заполняет ленты подписчиков заново по подпискам.'
+
+    def handle(self, *args, **options):
+        FeedEntry.objects.rebuild()
+        logger.info('Записей в лентах: %s', FeedEntry.objects.count())
@@ -0,0 +1,35 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного и корзин рецептов с таблицами '
+            'и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только показать расхождения, ничего не изменяя.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            fixed = Recipe.objects.recount()
+            logger.info('Исправлено рецептов: %s', fixed)
+            return
+
+        mismatches = Recipe.objects.counter_mismatches().order_by('id')
+        for recipe in mismatches:
+            logger.warning(
+                'Рецепт %s: избранное %s (в таблице %s), '
+                'корзины %s (в таблице %s)',
+                recipe.id, recipe.favorites_count,
+                recipe.actual_favorites_count, recipe.in_carts_count,
+                recipe.actual_in_carts_count,
+            )
+        logger.info('Расхождений: %s', len(mismatches))
@@ -0,0 +1,41 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from recipes.models import ShoppingCartLine
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает или проверяет агрегат списков покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить с корзинами, ничего не изменяя.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            ShoppingCartLine.objects.rebuild()
+            logger.info('Список покупок пересчитан!')
+            return
+
+        expected = ShoppingCartLine.objects.get_expected()
+        lines = ShoppingCartLine.objects.values_list(
+            'user', 'ingredient', 'total_amount')
+        actual = {
+            (user, ingredient): total for user, ingredient, total in lines
+        }
+        mismatches = {
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        }
+        for user, ingredient in sorted(mismatches):
+            logger.warning(
+                'Пользователь %s, ингредиент %s: ожидалось %s, в таблице %s',
+                user, ingredient, expected.get((user, ingredient)),
+                actual.get((user, ingredient)),
+            )
+        logger.info('Расхождений: %s', len(mismatches))
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_shopping_cart_lines(apps, schema_editor):
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingCartLine = apps.get_model('recipes', 'ShoppingCartLine')
+    totals = IngredientInRecipe.objects.values(
+        'ingredient', user=models.F('recipe__shopping_cart__user')
+    ).annotate(
+        total=models.Sum('amount')
+    ).order_by().filter(user__isnull=False)
+    ShoppingCartLine.objects.bulk_create(
+        ShoppingCartLine(user_id=item['user'],
+                         ingredient_id=item['ingredient'],
+                         total_amount=item['total'])
+        for item in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0003_alter_ingredientinrecipe_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_lines', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_lines', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Строка списка покупок',
+                'verbose_name_plural': 'Строки списка покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartline',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_cart_line'),
+        ),
+        migrations.RunPython(fill_shopping_cart_lines,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:09
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=['search_vector'], name='recipe_search_vector_idx'
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('recipes', 'Recipe'),
+                                SEARCH_INDEX)
+        schema_editor.execute(
+            "UPDATE recipes_recipe SET search_vector = "
+            "setweight(to_tsvector('russian', name), 'A') || "
+            "setweight(to_tsvector('russian', text), 'B') || "
+            "setweight(to_tsvector('russian', coalesce(("
+            "SELECT string_agg(i.name, ' ') "
+            "FROM recipes_ingredientinrecipe ir "
+            "JOIN recipes_ingredient i ON i.id = ir.ingredient_id "
+            "WHERE ir.recipe_id = recipes_recipe.id), '')), 'C')"
+        )
+    elif schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE recipes_recipe_fts '
+            'USING fts5(name, text, ingredients)'
+        )
+        schema_editor.execute(
+            'INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients) '
+            'SELECT r.id, r.name, r.text, '
+            "coalesce(group_concat(i.name, ' '), '') "
+            'FROM recipes_recipe r '
+            'LEFT JOIN recipes_ingredientinrecipe ir ON ir.recipe_id = r.id '
+            'LEFT JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+            'GROUP BY r.id'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('recipes', 'Recipe'),
+                                   SEARCH_INDEX)
+    elif schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppingcartline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=SEARCH_INDEX,
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_index, drop_search_index),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingCartLine = apps.get_model('recipes', 'ShoppingCartLine')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep=models.Min('id'), total=models.Count('id')
+    ).order_by().filter(total__gt=1)
+    for group in duplicates:
+        extra = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=group['keep'])
+        IngredientInRecipe.objects.filter(ingredient__in=extra).update(
+            ingredient_id=group['keep'])
+        for line in ShoppingCartLine.objects.filter(ingredient__in=extra):
+            kept, _ = ShoppingCartLine.objects.get_or_create(
+                user_id=line.user_id, ingredient_id=group['keep'],
+                defaults={'total_amount': 0})
+            kept.total_amount += line.total_amount
+            kept.save()
+            line.delete()
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+    ]
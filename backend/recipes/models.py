@@ -1,11 +1,22 @@
 import re
+from itertools import islice
 
 from colorfield.fields import ColorField
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from django.db.models import UniqueConstraint
-from users.models import User
+from django.db import connections, models, transaction
+from django.db.models import (Count, Exists, F, OuterRef, Q, Subquery, Sum,
+                              UniqueConstraint, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest, RowNumber
+from django.dispatch import Signal
+from django.utils import timezone
+from users.models import Subscribe, User
+
+from .search import update_search_index
 
 MAX_LENGTH_STRING = 200
 MAX_LENGTH_COLOR = 7
@@ -25,6 +36,17 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name']
+        constraints = [
+            UniqueConstraint(fields=['name', 'measurement_unit'],
+                             name='unique_ingredient')
+        ]
+        indexes = [
+            # Поиск по началу названия (LIKE 'лук%') в PostgreSQL.
+            models.Index(fields=['name'], name='ingredient_name_prefix_idx',
+                         opclasses=['varchar_pattern_ops']),
+            GinIndex(fields=['name'], name='ingredient_name_trgm_idx',
+                     opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -57,6 +79,77 @@ class Tag(models.Model):
         return self.name
 
 
+# Счётчики меняются через update() без post_save; получатели узнают
+# об этом по отдельному сигналу.
+counters_changed = Signal()
+
+
+class RecipeQuerySet(models.QuerySet):
+    def limit_per_author(self, limit):
+        """Оставляет не более limit последних рецептов каждого автора."""
+        if connections[self.db].features.supports_over_clause:
+            ranked = self.annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=F('id').desc(),
+            )).values('id', 'row_number')
+            sql, params = ranked.query.sql_with_params()
+            return self.model.objects.filter(id__in=RawSQL(
+                f'SELECT ranked.id FROM ({sql}) ranked '
+                'WHERE ranked.row_number <= %s',
+                (*params, limit),
+            ))
+        latest = self.model.objects.filter(
+            author=OuterRef('author')
+        ).order_by('-id').values('id')[:limit]
+        return self.filter(id__in=Subquery(latest))
+
+    def change_counter(self, field, delta):
+        """Атомарно меняет счётчик favorites_count или in_carts_count."""
+        updated = self.update(updated_at=timezone.now(),
+                              **{field: Greatest(F(field) + delta, 0)})
+        if updated:
+            counters_changed.send(sender=self.model)
+        return updated
+
+    def touch(self):
+        """Отмечает изменение данных рецептов, которые отдаёт API."""
+        return self.update(updated_at=timezone.now())
+
+    def with_actual_counters(self):
+        return self.annotate(
+            actual_favorites_count=count_by_recipe(Favorite),
+            actual_in_carts_count=count_by_recipe(ShoppingCart),
+        )
+
+    def counter_mismatches(self):
+        """Рецепты, у которых счётчики разошлись с таблицами
+        избранного и корзин."""
+        return self.with_actual_counters().exclude(
+            favorites_count=F('actual_favorites_count'),
+            in_carts_count=F('actual_in_carts_count'),
+        )
+
+    def recount(self):
+        """Исправляет разошедшиеся счётчики, возвращает число рецептов."""
+        ids = list(self.counter_mismatches().values_list('id', flat=True))
+        updated = self.model.objects.filter(id__in=ids).update(
+            favorites_count=count_by_recipe(Favorite),
+            in_carts_count=count_by_recipe(ShoppingCart),
+            updated_at=timezone.now(),
+        )
+        if updated:
+            counters_changed.send(sender=self.model)
+        return updated
+
+
+def count_by_recipe(model):
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by()
+        .values('recipe').annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
 class Recipe(models.Model):
     name = models.CharField(
         'Название',
@@ -67,6 +160,7 @@ class Recipe(models.Model):
         related_name='recipes',
         on_delete=models.SET_NULL,
         null=True,
+        db_index=False,
         verbose_name='Автор',
     )
     text = models.TextField('Описание')
@@ -74,6 +168,12 @@ class Recipe(models.Model):
         'Изображение',
         upload_to='recipes/'
     )
+    image_variants = models.JSONField(
+        'Варианты изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления',
         validators=[
@@ -94,6 +194,34 @@ class Recipe(models.Model):
         related_name='recipes',
         verbose_name='Теги'
     )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В корзинах',
+        default=0,
+        editable=False
+    )
+    # Рецепты, которые ещё не разосланы (или не рассылаются вовсе, см.
+    # recipes.feed), лента подписчика читает напрямую у автора.
+    fanned_out = models.BooleanField(
+        'Разослан по лентам',
+        default=False,
+        editable=False
+    )
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    # Меняется вместе с любыми данными, которые API отдаёт о рецепте:
+    # ингредиентами, тегами, счётчиками и профилем автора.
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+
+    objects = RecipeQuerySet.as_manager()
 
     def clean(self):
         super().clean()
@@ -105,16 +233,32 @@ class Recipe(models.Model):
         ordering = ['-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            GinIndex(fields=['search_vector'],
+                     name='recipe_search_vector_idx'),
+            models.Index(fields=['-favorites_count', '-id'],
+                         name='recipe_popular_idx'),
+            models.Index(fields=['author', '-id'], name='recipe_author_idx'),
+            models.Index(fields=['author', '-id'],
+                         condition=Q(fanned_out=False),
+                         name='recipe_feed_pull_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, update_index=True, **kwargs):
+        super().save(*args, **kwargs)
+        if update_index:
+            update_search_index([self.pk], using=self._state.db)
+
 
 class IngredientInRecipe(models.Model):
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
         related_name='ingredient_list',
+        db_index=False,
         verbose_name='Рецепт',
     )
     ingredient = models.ForeignKey(
@@ -134,6 +278,16 @@ class IngredientInRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецептах'
+        constraints = [
+            UniqueConstraint(fields=['recipe', 'ingredient'],
+                             name='unique_ingredient_in_recipe')
+        ]
+        indexes = [
+            # Суммы по корзинам считаются только по индексу, без чтения
+            # строк таблицы.
+            models.Index(fields=['recipe'], include=['ingredient', 'amount'],
+                         name='ingredient_in_recipe_cover_idx'),
+        ]
 
     def __str__(self):
         return (
@@ -143,6 +297,8 @@ class IngredientInRecipe(models.Model):
 
 
 class Favorite(models.Model):
+    counter_field = 'favorites_count'
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -169,6 +325,8 @@ class Favorite(models.Model):
 
 
 class ShoppingCart(models.Model):
+    counter_field = 'in_carts_count'
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -192,3 +350,211 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил "{self.recipe}" в Корзину покупок'
+
+
+class ShoppingCartLineQuerySet(models.QuerySet):
+    def add_recipe(self, user, recipe):
+        self._apply_recipes(user, [recipe], 1)
+
+    def remove_recipe(self, user, recipe):
+        self._apply_recipes(user, [recipe], -1)
+
+    def add_recipes(self, user, recipes):
+        self._apply_recipes(user, recipes, 1)
+
+    def remove_recipes(self, user, recipes):
+        self._apply_recipes(user, recipes, -1)
+
+    @transaction.atomic
+    def _apply_recipes(self, user, recipes, sign):
+        amounts = dict(
+            IngredientInRecipe.objects.filter(recipe__in=recipes)
+            .values('ingredient_id').annotate(total=Sum('amount'))
+            .order_by().values_list('ingredient_id', 'total')
+        )
+        lines = {
+            line.ingredient_id: line
+            for line in self.select_for_update().filter(
+                user=user, ingredient_id__in=amounts)
+        }
+        to_create, to_update, to_delete = [], [], []
+        for ingredient_id, amount in amounts.items():
+            line = lines.get(ingredient_id)
+            if line is None:
+                if sign > 0:
+                    to_create.append(self.model(
+                        user=user, ingredient_id=ingredient_id,
+                        total_amount=amount))
+                continue
+            line.total_amount += sign * amount
+            if line.total_amount > 0:
+                to_update.append(line)
+            else:
+                to_delete.append(line.pk)
+        self.bulk_create(to_create)
+        self.bulk_update(to_update, ['total_amount'])
+        if to_delete:
+            self.filter(pk__in=to_delete).delete()
+
+    def expected_totals(self, users=None, ingredients=None):
+        """Запрос сумм ингредиентов напрямую по корзинам."""
+        totals = IngredientInRecipe.objects.values(
+            'ingredient', user=F('recipe__shopping_cart__user')
+        ).annotate(total=Sum('amount')).order_by().filter(user__isnull=False)
+        if users is not None:
+            totals = totals.filter(user__in=users)
+        if ingredients is not None:
+            totals = totals.filter(ingredient__in=ingredients)
+        return totals
+
+    def get_expected(self, users=None, ingredients=None):
+        """Суммы ингредиентов, посчитанные напрямую по корзинам."""
+        return {
+            (item['user'], item['ingredient']): item['total']
+            for item in self.expected_totals(users, ingredients)
+        }
+
+    @transaction.atomic
+    def rebuild(self, users=None, ingredients=None):
+        """Пересчитывает строки заново для выбранных пользователей
+        и ингредиентов (по умолчанию — для всех)."""
+        lines = self.all()
+        if users is not None:
+            lines = lines.filter(user__in=users)
+        if ingredients is not None:
+            lines = lines.filter(ingredient__in=ingredients)
+        lines.delete()
+        self.bulk_create(
+            self.model(user_id=user, ingredient_id=ingredient,
+                       total_amount=total)
+            for (user, ingredient), total
+            in self.get_expected(users, ingredients).items()
+        )
+
+
+class ShoppingCartLine(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_lines',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_lines',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingCartLineQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списка покупок'
+        constraints = [
+            UniqueConstraint(fields=['user', 'ingredient'],
+                             name='unique_shopping_cart_line')
+        ]
+
+    def __str__(self):
+        return (
+            f'{self.user}: {self.ingredient.name} '
+            f'({self.ingredient.measurement_unit}) - {self.total_amount}'
+        )
+
+
+class FeedEntryQuerySet(models.QuerySet):
+    def page(self, user, before=None, limit=None):
+        """id рецептов ленты user по убыванию, меньшие before.
+
+        Берутся limit последних записей ленты и limit последних
+        неразосланных рецептов авторов из подписок; каждая выборка
+        идёт по своему индексу. Записи проверяются по текущим
+        подпискам: фоновая рассылка могла добавить рецепт уже после
+        отписки.
+        """
+        entries = self.filter(
+            Exists(Subscribe.objects.filter(
+                user=user, author=OuterRef('recipe__author'))),
+            user=user,
+        ).order_by('-recipe_id')
+        pulled = Recipe.objects.filter(
+            fanned_out=False, author__following__user=user
+        ).order_by('-id')
+        if before is not None:
+            entries = entries.filter(recipe__lt=before)
+            pulled = pulled.filter(id__lt=before)
+        ids = set(entries.values_list('recipe', flat=True)[:limit])
+        ids.update(pulled.values_list('id', flat=True)[:limit])
+        return sorted(ids, reverse=True)[:limit]
+
+    def follow(self, user, author):
+        """Добавляет в ленту user последние рецепты автора."""
+        recipes = Recipe.objects.filter(author=author).values_list(
+            'id', flat=True)[:settings.FEED_BACKFILL]
+        self.bulk_create(
+            [self.model(user=user, recipe_id=pk) for pk in recipes],
+            ignore_conflicts=True,
+        )
+
+    def unfollow(self, user, author):
+        self.filter(user=user, recipe__author=author).delete()
+
+    @transaction.atomic
+    def rebuild(self):
+        """Заполняет ленты заново по подпискам.
+
+        Авторы, у которых меньше FEED_PULL_FOLLOWERS подписчиков,
+        рассылают последние FEED_BACKFILL рецептов, остальные читаются
+        лентой напрямую.
+        """
+        self.all().delete()
+        pushed = User.objects.annotate(
+            followers=Count('following')
+        ).filter(followers__lt=settings.FEED_PULL_FOLLOWERS).values('id')
+        Recipe.objects.exclude(author__in=pushed).update(fanned_out=False)
+        Recipe.objects.filter(author__in=pushed).update(fanned_out=True)
+        rows = Recipe.objects.filter(author__in=pushed).limit_per_author(
+            settings.FEED_BACKFILL
+        ).values_list('author__following__user', 'id').iterator()
+        while True:
+            batch = list(islice(rows, settings.FEED_FANOUT_BATCH))
+            if not batch:
+                break
+            self.bulk_create(
+                self.model(user_id=user, recipe_id=recipe)
+                for user, recipe in batch if user is not None
+            )
+
+
+class FeedEntry(models.Model):
+    """Рецепт автора в ленте подписчика."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        db_index=False,
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            # Индекс ограничения служит и для страниц ленты по убыванию id.
+            UniqueConstraint(fields=['user', 'recipe'],
+                             name='unique_feed_entry')
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
@@ -0,0 +1,82 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса колонок FTS5 в порядке name, text, ingredients.
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def is_postgres(using):
+    return connections[using].vendor == 'postgresql'
+
+
+def update_search_index(recipe_ids, using='default'):
+    """Пересчитывает поисковый индекс для рецептов с recipe_ids."""
+    from .models import IngredientInRecipe, Recipe
+
+    if is_postgres(using):
+        names = IngredientInRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        Recipe.objects.using(using).filter(pk__in=recipe_ids).update(
+            search_vector=(
+                SearchVector('name', weight='A', config=SEARCH_CONFIG)
+                + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+                + SearchVector(Coalesce(Subquery(names), Value('')),
+                               weight='C', config=SEARCH_CONFIG)
+            )
+        )
+        return
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            recipe_ids
+        )
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+            'SELECT r.id, r.name, r.text, '
+            "coalesce(group_concat(i.name, ' '), '') "
+            'FROM recipes_recipe r '
+            'LEFT JOIN recipes_ingredientinrecipe ir ON ir.recipe_id = r.id '
+            'LEFT JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+            f'WHERE r.id IN ({placeholders}) GROUP BY r.id',
+            recipe_ids
+        )
+
+
+def to_fts_query(value):
+    """Запрос FTS5: каждое слово в кавычках и с поиском по префиксу,
+    что отчасти заменяет морфологию русского языка."""
+    words = (word.replace('"', '""') for word in value.split())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, value):
+    """Рецепты, подходящие под запрос, по убыванию релевантности."""
+    if is_postgres(queryset.db):
+        query = SearchQuery(value, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+    query = to_fts_query(value)
+    if not query:
+        return queryset
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.annotate(rank=RawSQL(
+        f'SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = recipes_recipe.id',
+        (query,)
+    )).filter(rank__isnull=False).order_by('rank', '-id')